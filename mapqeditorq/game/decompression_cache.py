@@ -0,0 +1,225 @@
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class CacheInUseError(Exception):
+    pass
+
+
+def lock_file(f):
+    """Locks the open file f without waiting. Returns False if another process has it locked."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DecompressionCache:
+    """
+    Keeps decompressed blobs on disk, so the same data is not decompressed
+    again every time a map is opened.
+    Blobs are appended to a data file that is read through mmap, while a
+    small index file maps (rom sha1, compressed data offset) to the blob.
+    When the blobs exceed max_size, the least recently used ones are dropped.
+    The index is written every INDEX_SAVE_INTERVAL new blobs and when the cache
+    is closed. Blobs appended after the last index write are just not found.
+    Both files start with the generation of the data file, which changes each
+    time the blobs are moved. An index of another generation is discarded,
+    so a crash between writing both files can't give wrong blobs.
+    Only one process can use the cache at a time: it is locked until closed,
+    and CacheInUseError is raised if another process has it. That process
+    (a second editor, for instance) has to work without the cache.
+    """
+    INDEX_FILENAME = 'lz77_cache.idx'
+    DATA_FILENAME = 'lz77_cache.bin'
+    LOCK_FILENAME = 'lz77_cache.lock'
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    INDEX_SAVE_INTERVAL = 64
+
+    #                      magic, generation
+    HEADER_STRUCT = struct.Struct('<4sQ')
+    MAGIC = b'MQLZ'
+    #                     rom sha1, rom offset, data offset, data size, compressed size, last use
+    ENTRY_STRUCT = struct.Struct('<20sIQIIQ')
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.index_filename = os.path.join(directory, self.INDEX_FILENAME)
+        self.data_filename = os.path.join(directory, self.DATA_FILENAME)
+        self.max_size = max_size
+
+        self.entries = {}
+        self.use_count = 0
+        self.data_size = 0
+        self.generation = 0
+        self.data_map = None
+        self.unsaved_entries = 0
+        self.lock = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock_file = open(os.path.join(directory, self.LOCK_FILENAME), 'a+b')
+        if not lock_file(self.lock_file):
+            self.lock_file.close()
+            self.lock_file = None
+            raise CacheInUseError('The decompression cache is being used by another process')
+        self.load_index()
+
+    def read_header(self, filename):
+        # Returns the generation of the file, or None if it isn't a cache file
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(self.HEADER_STRUCT.size)
+        except FileNotFoundError:
+            return None
+        if len(header) != self.HEADER_STRUCT.size:
+            return None
+        magic, generation = self.HEADER_STRUCT.unpack(header)
+        if magic != self.MAGIC:
+            return None
+        return generation
+
+    def load_index(self):
+        data_generation = self.read_header(self.data_filename)
+        if data_generation is None:
+            self.reset_data_file(0)
+            return
+        self.generation = data_generation
+        self.data_size = os.path.getsize(self.data_filename)
+        if self.read_header(self.index_filename) != data_generation:
+            # Missing, or written for other blobs: start over
+            self.reset_data_file(data_generation + 1)
+            return
+
+        with open(self.index_filename, 'rb') as f:
+            index = f.read()[self.HEADER_STRUCT.size:]
+        if len(index) % self.ENTRY_STRUCT.size != 0:
+            # Corrupted index, start over
+            self.reset_data_file(data_generation + 1)
+            return
+        for rom_hash, rom_offset, data_offset, size, compressed_size, last_use \
+                in self.ENTRY_STRUCT.iter_unpack(index):
+            if data_offset + size <= self.data_size:
+                self.entries[(rom_hash, rom_offset)] = [data_offset, size, compressed_size, last_use]
+                self.use_count = max(self.use_count, last_use)
+
+    def reset_data_file(self, generation):
+        self.generation = generation
+        self.write_data_file(self.data_filename, [])
+
+    def write_data_file(self, filename, blobs):
+        # Returns the offset of each blob
+        offsets = []
+        with open(filename, 'wb') as f:
+            f.write(self.HEADER_STRUCT.pack(self.MAGIC, self.generation))
+            offset = self.HEADER_STRUCT.size
+            for blob in blobs:
+                f.write(blob)
+                offsets.append(offset)
+                offset += len(blob)
+        self.data_size = offset
+        return offsets
+
+    def save_index(self):
+        index = bytearray(self.HEADER_STRUCT.pack(self.MAGIC, self.generation))
+        for (rom_hash, rom_offset), entry in self.entries.items():
+            index += self.ENTRY_STRUCT.pack(rom_hash, rom_offset, *entry)
+        tmp_filename = self.index_filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(index)
+        os.replace(tmp_filename, self.index_filename)
+        self.unsaved_entries = 0
+
+    def get_data_map(self, end):
+        # Mapped again only when end is past the mapped part, as blobs are appended
+        if self.data_map is None or len(self.data_map) < end:
+            self.close_data_map()
+            with open(self.data_filename, 'rb') as f:
+                self.data_map = mmap.mmap(f.fileno(), self.data_size, access=mmap.ACCESS_READ)
+        return self.data_map
+
+    def close_data_map(self):
+        if self.data_map is not None:
+            self.data_map.close()
+            self.data_map = None
+
+    def get(self, rom_hash, rom_offset):
+        with self.lock:
+            entry = self.entries.get((rom_hash, rom_offset))
+            if entry is None:
+                return None
+            data_offset, size, compressed_size, _ = entry
+            self.use_count += 1
+            entry[3] = self.use_count
+            data = bytearray(self.get_data_map(data_offset + size)[data_offset:data_offset + size])
+        return data, compressed_size
+
+    def put(self, rom_hash, rom_offset, data, compressed_size):
+        with self.lock:
+            if (rom_hash, rom_offset) in self.entries or len(data) > self.max_size:
+                return
+            with open(self.data_filename, 'ab') as f:
+                f.write(data)
+            self.use_count += 1
+            self.entries[(rom_hash, rom_offset)] = [self.data_size, len(data), compressed_size, self.use_count]
+            self.data_size += len(data)
+            self.unsaved_entries += 1
+
+            if self.data_size > self.max_size:
+                # The blobs are moved, so the index can't wait
+                self.evict()
+                self.save_index()
+            elif self.unsaved_entries >= self.INDEX_SAVE_INTERVAL:
+                self.save_index()
+
+    def evict(self):
+        # Drop the least recently used blobs, then compact them into a data file
+        live_size = sum(entry[1] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1][3]):
+            if live_size <= self.max_size:
+                break
+            del self.entries[key]
+            live_size -= entry[1]
+
+        # of the next generation. The index must be saved right after it.
+        data_map = self.get_data_map(self.data_size)
+        tmp_filename = self.data_filename + '.tmp'
+        entries = list(self.entries.values())
+        self.generation += 1
+        offsets = self.write_data_file(
+            tmp_filename, (data_map[entry[0]:entry[0] + entry[1]] for entry in entries)
+        )
+        for entry, offset in zip(entries, offsets):
+            entry[0] = offset
+        self.close_data_map()
+        os.replace(tmp_filename, self.data_filename)
+
+    def close(self):
+        with self.lock:
+            if self.lock_file is None:
+                return
+            self.close_data_map()
+            self.save_index()
+            unlock_file(self.lock_file)
+            self.lock_file.close()
+            self.lock_file = None
@@ -1,8 +1,18 @@
 
+import hashlib
+import mmap
+import os
+import struct
+
+import numpy as np
+
 from mapqeditorq.game import lz77
+from mapqeditorq.game.pointer_index import PointerIndex
+from mapqeditorq.game.structure_utils import LazyStructArray
 
 from mapqeditorq.maps.maps import MapHeader
-from mapqeditorq.maps.common import MapDataGenericHeader
+from mapqeditorq.maps.common import MapDataGenericHeader, decode_mapdata_pointer, is_final_encoded_pointer
+from mapqeditorq.maps.warps import MapWarp
 
 
 class Game:
@@ -48,6 +58,15 @@ class Game:
         0x08052e84,
     )
 
+    # Tables moved by the project, and the pointers to them that are repointed
+    REPOINTED_TABLES = (
+        ('headers', MAP_HEADER_TABLE, PTRS_TO_MAP_HEADER_TABLE),
+        ('tilesets', TILESETS_TABLE, PTRS_TO_MAP_TILESETS_TABLE),
+        ('layers', MAP_LAYER_HEADER_TABLE, PTRS_TO_MAP_LAYERS_TABLE),
+        ('blocks', BLOCKS_TABLE, PTRS_TO_MAP_BLOCKS_TABLE),
+        ('warps', WARPS_TABLE, PTRS_TO_MAP_WARPS_TABLE),
+    )
+
     SCRIPTS_TABLE = 0xd50fc
 
     PALETTE_HEADER2_TABLE = 0xff850
@@ -55,17 +74,51 @@ class Game:
 
     unk_table_5 = 0x127d30
 
+    MAX_MAP_GROUPS = 0x80
+    MAX_MAP_GROUP_LENGTH = 0x80
+
+    POINTER_INDEX_EXTENSION = '.ptridx'
+
+    U32_STRUCT = struct.Struct('<I')
+
     def __init__(self):
+        self.rom_filename = None
+        # The rom is memory-mapped, so it is shared with every other process using it
         self.rom_contents = None
+        self.rom_view = None
+        self.rom_hash = None
+        self.decompression_cache = None
+        # Data decompressed ahead by prefetch_compressed, by address
+        self.prefetched_data = {}
+        self.map_group_lengths = None
+        self.pointer_index = None
 
     def load(self, filename):
-        with open(filename, 'rb+') as f:
-            self.rom_contents = f.read()
+        self.close()
+        self.pointer_index = None
+        with open(filename, 'rb') as f:
+            self.rom_contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.rom_view = memoryview(self.rom_contents)
+        self.rom_filename = os.path.abspath(filename)
+        self.rom_hash = hashlib.sha1(self.rom_view).digest()
         if self.read(0xac, 4) != b'BZME':
             # Warning
             return 1
         return 0
 
+    def close(self):
+        if self.rom_contents is not None:
+            try:
+                self.rom_view.release()
+                self.rom_contents.close()
+            except BufferError:
+                # Something still points into the mapped rom. The file is unmapped
+                # when the last reference is collected.
+                pass
+            self.rom_view = None
+            self.rom_contents = None
+        self.prefetched_data = {}
+
     @staticmethod
     def pointer_mask(address):
         return address + 0x8000000
@@ -74,13 +127,35 @@ class Game:
     def pointer_unmask(address):
         return address - 0x8000000
 
+    def is_rom_pointer(self, pointer):
+        return 0 <= self.pointer_unmask(pointer) < len(self.rom_contents)
+
+    def get_pointer_index(self):
+        # Built once and saved next to the rom
+        if self.pointer_index is None:
+            filename = self.rom_filename + self.POINTER_INDEX_EXTENSION
+            self.pointer_index = PointerIndex.load(filename, self.rom_hash)
+            if self.pointer_index is None:
+                self.pointer_index = PointerIndex.build(self.rom_view)
+                self.pointer_index.save(filename, self.rom_hash)
+        return self.pointer_index
+
+    def find_unknown_pointers_to(self, address, known_pointers=()):
+        """
+        Masked addresses of the words with the value of a pointer to address,
+        that are not in known_pointers. They may be data that looks like a
+        pointer, so they are only reported, never repointed.
+        """
+        referrers = self.get_pointer_index().get_referrers(address)
+        return sorted({self.pointer_mask(referrer) for referrer in referrers} - set(known_pointers))
+
     def read(self, address, amount_of_bytes):
         if address < 0:
             raise Exception('"{}" is not a valid offset.'.format(address))
         return self.rom_contents[address:address + amount_of_bytes]
 
     def read_u32(self, address):
-        return int.from_bytes(self.read(address, 4), 'little')
+        return self.U32_STRUCT.unpack_from(self.rom_view, address)[0]
 
     def read_pointer(self, address):
         return self.pointer_unmask(self.read_u32(address))
@@ -88,13 +163,58 @@ class Game:
     def loaded(self):
         return self.rom_contents is not None
 
+    def set_decompression_cache(self, cache):
+        self.decompression_cache = cache
+
     def read_compressed(self, address):
-        return lz77.decompress(self.rom_contents[address::])
+        prefetched = self.prefetched_data.pop(address, None)
+        if prefetched is not None:
+            return prefetched
+        if self.decompression_cache is not None:
+            cached = self.decompression_cache.get(self.rom_hash, address)
+            if cached is not None:
+                return cached
+
+        data, compressed_size = lz77.decompress(self.rom_view, address)
+        if self.decompression_cache is not None:
+            self.decompression_cache.put(self.rom_hash, address, data, compressed_size)
+        return data, compressed_size
+
+    def read_compressed_many(self, addresses, max_workers=None, skip_invalid=False):
+        addresses = list(addresses)
+        results = [None] * len(addresses)
+        missing = []
+        for i, address in enumerate(addresses):
+            if self.decompression_cache is not None:
+                results[i] = self.decompression_cache.get(self.rom_hash, address)
+            if results[i] is None:
+                missing.append(i)
+
+        decompressed = lz77.decompress_many(
+            self.rom_filename, (addresses[i] for i in missing), max_workers, skip_invalid
+        )
+        for i, result in zip(missing, decompressed):
+            results[i] = result
+            if result is not None and self.decompression_cache is not None:
+                self.decompression_cache.put(self.rom_hash, addresses[i], *result)
+        return results
+
+    def prefetch_compressed(self, addresses, max_workers=None):
+        # Decompressed in parallel, to be taken by read_compressed.
+        # Replaces the data prefetched before. Invalid data is left for read_compressed to report.
+        addresses = list(set(addresses))
+        results = self.read_compressed_many(addresses, max_workers, skip_invalid=True)
+        self.prefetched_data = {
+            address: result for address, result in zip(addresses, results) if result is not None
+        }
 
     def read_struct_at(self, address, StructClass):
-        struct_obj = StructClass()
-        struct_obj.load_from_bytes(self.read(address, StructClass.size()))
-        return struct_obj
+        return StructClass.unpack_from(self.rom_view, address)
+
+    def read_struct_table(self, address, length, StructClass):
+        # The array is a view of the mapped rom, only valid until the game is closed.
+        # Copy it (or convert it with tolist) to keep it.
+        return StructClass.as_numpy_array(self.rom_view, address, length)
 
     def get_map_header_pointer(self, map_index, map_subindex):
         header_data_subtable = self.MAP_HEADER_TABLE + map_index * 4
@@ -133,33 +253,117 @@ class Game:
         return self.read_pointer(sub_table_ptr + map_subindex * 4)
 
     def read_u32_array(self, address, length):
-        array = []
-        for i in range(length):
-            array.append(self.read_u32(address))
-            address += 4
-        return array
+        return list(struct.unpack_from('<{0}I'.format(length), self.rom_view, address))
 
     def read_struct_array(self, address, length, StructClass):
-        array = []
-        for i in range(length):
-            array.append(self.read_struct_at(address, StructClass))
-            address += StructClass.size()
-        return array
+        return StructClass.unpack_array(self.rom_view, address, length)
+
+    def find_map_group_lengths(self):
+        """
+        Walks the map header table to find how many groups there are, and
+        how many headers each group has.
+        The main table ends at the first group subtable placed after it, at
+        the first word that isn't a pointer or at the first group without
+        valid maps. Empty entries are empty groups.
+        Each group is validated entry by entry, see find_map_group_length.
+        """
+        group_addresses = []
+        table_end = None
+        address = self.MAP_HEADER_TABLE
+        while len(group_addresses) < self.MAX_MAP_GROUPS and (table_end is None or address < table_end):
+            pointer = self.read_u32(address)
+            if pointer == 0:
+                group_addresses.append(None)
+            elif not self.is_rom_pointer(pointer):
+                break
+            else:
+                group_address = self.pointer_unmask(pointer)
+                group_addresses.append(group_address)
+                if group_address > self.MAP_HEADER_TABLE and (table_end is None or group_address < table_end):
+                    table_end = group_address
+            address += 4
+
+        layer_addresses = []
+        for group in range(len(group_addresses)):
+            pointer = self.read_u32(self.MAP_LAYER_HEADER_TABLE + 4 * group)
+            layer_addresses.append(self.pointer_unmask(pointer) if self.is_rom_pointer(pointer) else None)
+        # Where each group begins, to tell the next group apart from a shared or overlapping one
+        group_starts = {
+            (group_address, layer_address)
+            for group_address, layer_address in zip(group_addresses, layer_addresses)
+            if group_address is not None and layer_address is not None
+        }
+
+        lengths = []
+        for group_address, layer_address in zip(group_addresses, layer_addresses):
+            if group_address is None:
+                lengths.append(0)
+                continue
+            length = self.find_map_group_length(group_address, layer_address, group_starts)
+            if length == 0:
+                break
+            lengths.append(length)
+        while lengths and lengths[-1] == 0:
+            lengths.pop()
+        return lengths
+
+    def find_map_group_length(self, group_address, layer_address, group_starts):
+        """
+        Counts the headers of a group, until the first map without valid
+        layer headers. A map with a broken header still counts, it is
+        reported when extracted.
+        The group also ends where the headers and the layers of another
+        group begin together, or where its header table would reach the
+        main table or the end of the rom.
+        """
+        if layer_address is None:
+            return 0
+        if group_address < self.MAP_HEADER_TABLE:
+            headers_end = self.MAP_HEADER_TABLE
+        else:
+            headers_end = len(self.rom_contents)
+        length = 0
+        while length < self.MAX_MAP_GROUP_LENGTH:
+            header_address = group_address + length * MapHeader.size()
+            layer_entry_address = layer_address + length * 4
+            if header_address + MapHeader.size() > headers_end:
+                break
+            if length > 0 and (header_address, layer_entry_address) in group_starts:
+                break
+            if layer_entry_address + 4 > len(self.rom_contents) \
+                    or not self.is_map_layer_headers_pointer(self.read_u32(layer_entry_address)):
+                break
+            length += 1
+        return length
+
+    def is_map_layer_headers_pointer(self, pointer):
+        if not self.is_rom_pointer(pointer):
+            return False
+        address = self.pointer_unmask(pointer)
+        if address + MapDataGenericHeader.size() > len(self.rom_contents):
+            return False
+        header = self.read_struct_at(address, MapDataGenericHeader)
+        return header.uncompress_address in MapDataGenericHeader.HEADER_TYPE_DICT
+
+    def set_map_group_lengths(self, lengths):
+        self.map_group_lengths = lengths
 
     def get_map_groups_quanty(self):
-        # FIXME: check the actual quantity
-        return 0x80
+        if self.map_group_lengths is None:
+            return self.MAX_MAP_GROUPS
+        return len(self.map_group_lengths)
 
     def get_map_group_length(self, group):
-        # FIXME: check the actual quantity
-        return 0x80
+        if self.map_group_lengths is None:
+            return self.MAX_MAP_GROUP_LENGTH
+        return self.map_group_lengths[group]
 
     def get_map_header_array(self, group=None):
         address = self.MAP_HEADER_TABLE
         if group is not None:
             address += 4 * group
             address = self.read_pointer(address)
-            array = self.read_struct_array(address, self.get_map_group_length(group), MapHeader)
+            array = LazyStructArray(MapHeader, self.rom_view, address, self.get_map_group_length(group))
         else:
             array = self.read_u32_array(address, self.get_map_groups_quanty())
         return array
@@ -169,7 +373,7 @@ class Game:
 
     def read_mapdata_group_table(self, table_address, group):
         address = self.read_pointer(table_address + 4 * group)
-        return self.read_u32_array(address, self.get_map_groups_quanty())
+        return self.read_u32_array(address, self.get_map_group_length(group))
 
     def get_map_layer_array(self, group=None):
         if group is None:
@@ -189,6 +393,51 @@ class Game:
         else:
             return self.read_mapdata_group_table(self.WARPS_TABLE, group)
 
+    def get_map_header_table(self, group):
+        address = self.read_pointer(self.MAP_HEADER_TABLE + 4 * group)
+        return self.read_struct_table(address, self.get_map_group_length(group), MapHeader)
+
+    def get_warps_table(self, map_index, map_subindex):
+        address = self.get_warps_array_ptr(map_index, map_subindex)
+        length = 1
+        while self.read(address + (length - 1) * MapWarp.size(), 2) != b'\xff\xff':
+            length += 1
+        return self.read_struct_table(address, length, MapWarp)
+
+    def get_mapdata_generic_header_table(self, address):
+        length = 1
+        while not is_final_encoded_pointer(
+                self.read_u32(address + (length - 1) * MapDataGenericHeader.size())):
+            length += 1
+        return self.read_struct_table(address, length, MapDataGenericHeader)
+
+    def get_group_compressed_addresses(self, group):
+        # Compressed layers, blocks and tilesets of the valid maps of a group.
+        # Tables that can't be read are skipped, the extraction reports them.
+        map_headers = self.get_map_header_table(group)
+        valid = (map_headers['tiles_wide'] > 0) & (map_headers['tiles_high'] > 0)
+        # Getter and arguments of the address of each headers table
+        headers_tables = [
+            (self.get_map_layer_headers_address, (group, subindex))
+            for subindex in np.flatnonzero(valid).tolist()
+        ]
+        headers_tables.append((self.get_blocks_header_pointer, (group,)))
+        headers_tables += [
+            (self.get_tilesets_and_palette_headers_ptr, (group, tileset_subindex))
+            for tileset_subindex in np.unique(map_headers['tileset_subindex'][valid]).tolist()
+        ]
+
+        addresses = []
+        compressed_types = list(MapDataGenericHeader.HEADER_TYPE_DICT)
+        for get_address, args in headers_tables:
+            try:
+                table = self.get_mapdata_generic_header_table(get_address(*args))
+            except (IndexError, ValueError, struct.error):
+                continue
+            compressed = table[np.isin(table['uncompress_address'], compressed_types)]
+            addresses += [decode_mapdata_pointer(pointer) for pointer in compressed['masked_data_ptr'].tolist()]
+        return addresses
+
     def get_mapdata_generic_header_array(self, address):
         array = []
         while True:
@@ -1,3 +1,4 @@
+import numpy as np
 
 
 class ImageFormatError(Exception):
@@ -17,28 +18,52 @@ def validate_gbaimage(img):
 
 
 def format_palette(palette, colors=16):
-    formated = [[255, 255, 255]] * colors
-    for i in range(colors):
-        formated[i] = palette[i * 3: (i + 1) * 3]
-    return formated
+    """
+    Flat list of rgb values (as given by Image.getpalette) to an array of shape (colors, 3).
+    Missing colors are white.
+    """
+    values = np.asarray(palette, dtype=np.uint8).ravel()[:colors * 3]
+    formated = np.full(colors * 3, 255, dtype=np.uint8)
+    formated[:len(values)] = values
+    return formated.reshape(colors, 3)
+
+
+def gba_16colors_to_tiles(data):
+    """4bpp tile data to an array of shape (tiles, 8, 8) with the color index of every pixel."""
+    packed = np.frombuffer(data, dtype=np.uint8, count=len(data) // 32 * 32)
+    pixels = np.empty(packed.size * 2, dtype=np.uint8)
+    pixels[0::2] = packed & 0xf
+    pixels[1::2] = packed >> 4
+    return pixels.reshape(-1, 8, 8)
+
+
+def tiles_to_sheet(tiles, tiles_wide):
+    """
+    Arranges an array of tiles, of shape (tiles, h, w) or (tiles, h, w, channels),
+    in rows of tiles_wide, filling the last one with empty tiles.
+    """
+    tile_amount, h, w = tiles.shape[:3]
+    tiles_high = -(-tile_amount // tiles_wide)
+    missing = tiles_high * tiles_wide - tile_amount
+    if missing:
+        tiles = np.concatenate((tiles, np.zeros((missing,) + tiles.shape[1:], dtype=tiles.dtype)))
+    rows = tiles.reshape((tiles_high, tiles_wide) + tiles.shape[1:]).swapaxes(1, 2)
+    return rows.reshape((tiles_high * h, tiles_wide * w) + tiles.shape[3:])
+
+
+def sheet_to_tiles(sheet):
+    h, w = sheet.shape
+    return sheet.reshape(h // 8, 8, w // 8, 8).transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+
+
+def tiles_to_gba_16colors(tiles):
+    pixels = tiles.reshape(-1, 2)
+    return ((pixels[:, 0] & 0xf) | ((pixels[:, 1] & 0xf) << 4)).astype(np.uint8).tobytes()
 
 
 def img_to_gba_16colors(img):
     validate_gbaimage(img)
-    data = b''
-    imgdata = img.getdata()
-    w, h = img.size
-    tiles_h, tiles_w = h // 8, w // 8
-    for tile in range(tiles_h * tiles_w):
-        tile_data = b''
-        index = 8 * (tile % tiles_w) + w * 8 * (tile // tiles_w)
-        for j in range(8):
-            for i in range(4):
-                n = (imgdata[index + 2*i + j*w] & 0xf) | ((imgdata[index + 2*i + j*w + 1] & 0xf)<< 4)
-                tile_data += n.to_bytes(1, 'little')
-
-        data += tile_data
-    return data
+    return tiles_to_gba_16colors(sheet_to_tiles(np.asarray(img, dtype=np.uint8)))
 
 
 def img_palette_to_gba(img):
@@ -51,12 +76,7 @@ def palette_to_gba(palette):
 
 
 def pal_to_gba(palette):
-    data = b''
-    for color in palette:
-        r, g, b = color
-        r >>= 3
-        g >>= 3
-        b >>= 3
-        data += (r | (g << 5) | (b << 10)).to_bytes(2, 'little')
-    return data
+    """Colors with shape (colors, 3) to BGR555."""
+    rgb = np.asarray(palette, dtype=np.uint16).reshape(-1, 3) >> 3
+    return (rgb[:, 0] | (rgb[:, 1] << 5) | (rgb[:, 2] << 10)).astype('<u2').tobytes()
 
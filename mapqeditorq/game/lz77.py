@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import mmap
+
 to_int = lambda x: int.from_bytes(x, "little")
 
 
@@ -7,111 +11,267 @@ class InvalidLz77Data(Exception):
     pass
 
 
-def decompress(compressed_data):
+def decompress(compressed_data, offset=0):
     '''Decompresses lz77-compressed images in GBA ROMs.
        Algorithm originally ported from NLZ-Advance code
        (which has copyright by Nintenlord)
-       compressed data must be either a bytes() or a bytearray()
+       compressed data can be any object supporting the buffer protocol
+       (bytes, bytearray, mmap, memoryview...). It is never sliced, so the
+       whole ROM can be passed along with the offset of the data inside it.
        (this function was ported to python by cosarara97)'''
-    size = to_int(compressed_data[1:4])
-    decompressed_data = bytearray(size)
-    if compressed_data[0] != 0x10:
+    # Released even on errors, so a mapped file can be closed after them
+    with memoryview(compressed_data) as src:
+        return _decompress_view(src, offset)
+
+
+def _decompress_view(src, offset):
+    if src[offset] != 0x10:
         raise InvalidLz77Data('Not valid lz77 data')
+    size = to_int(src[offset + 1:offset + 4])
+    decompressed_data = bytearray(size)
     decomp_pos = 0
-    comp_pos = 4
+    comp_pos = offset + 4
     while decomp_pos < size:
         # Every bit of this byte maps to one of the eight following blocks
         # if the bit is 1, that block is compressed
-        byte = compressed_data[comp_pos]
-        are_compressed = [(byte >> 7-i) & 1 for i in range(8)]
+        flags = src[comp_pos]
         comp_pos += 1
-        # for block_i, is_compressed in enumerate(are_compressed):
-        for is_compressed in are_compressed:
-            if is_compressed:
-                amount_to_copy = 3 + (compressed_data[comp_pos]>>4)
-                to_copy_from = (1 +
-                                ((compressed_data[comp_pos] & 0xF) << 8) +
-                                compressed_data[comp_pos + 1])
-                if to_copy_from > size:
-                    raise Exception('Not valid lz77 data')
-                tmp_start = decomp_pos - to_copy_from
-                #tmp_start = decomp_pos
-                for i in range(amount_to_copy):
-                    if decomp_pos >= size:
-                        break
-                    decompressed_data[decomp_pos] = decompressed_data[
-                        tmp_start + i
-                        #tmp_start - to_copy_from + i
-                    ]
-                    decomp_pos += 1
-                comp_pos += 2
+        if flags == 0:
+            # Eight raw bytes in a row, copy them at once
+            amount = min(8, size - decomp_pos)
+            decompressed_data[decomp_pos:decomp_pos + amount] = src[comp_pos:comp_pos + amount]
+            decomp_pos += amount
+            comp_pos += amount
+            continue
 
+        for bit in range(7, -1, -1):
+            if decomp_pos >= size:
+                break
+            if (flags >> bit) & 1:
+                amount_to_copy = 3 + (src[comp_pos] >> 4)
+                to_copy_from = 1 + (((src[comp_pos] & 0xF) << 8) | src[comp_pos + 1])
+                comp_pos += 2
+                if to_copy_from > decomp_pos:
+                    raise InvalidLz77Data('Not valid lz77 data')
+                amount_to_copy = min(amount_to_copy, size - decomp_pos)
+                start = decomp_pos - to_copy_from
+                if to_copy_from >= amount_to_copy:
+                    decompressed_data[decomp_pos:decomp_pos + amount_to_copy] = \
+                        decompressed_data[start:start + amount_to_copy]
+                else:
+                    # The run overlaps with itself, so it repeats the last bytes
+                    pattern = decompressed_data[start:decomp_pos]
+                    repeated = pattern * (amount_to_copy // to_copy_from + 1)
+                    decompressed_data[decomp_pos:decomp_pos + amount_to_copy] = \
+                        repeated[:amount_to_copy]
+                decomp_pos += amount_to_copy
             else:
-                if decomp_pos >= size:
-                    break
-                decompressed_data[decomp_pos] = compressed_data[comp_pos]
+                decompressed_data[decomp_pos] = src[comp_pos]
                 decomp_pos += 1
                 comp_pos += 1
-            if decomp_pos > size:
-                break
-    return decompressed_data, comp_pos  # comp_pos contains the size of the compressed data
+    # Size of the compressed data (without the alignment padding)
+    return decompressed_data, comp_pos - offset
+
+
+WINDOW_SIZE = 0x1000
+MIN_MATCH_LENGTH = 3
+MAX_MATCH_LENGTH = 18
+# A distance of 1 breaks the BIOS routine that decompresses to VRAM
+# (it writes halfwords), so it is never used
+MIN_MATCH_DISTANCE = 2
+MAX_CHAIN_DEPTH = 256
+
+
+class HashChain:
+    """
+    Finds the longest previous occurrence of the bytes at a position,
+    looking only at the positions that share its first three bytes.
+    Positions have to be inserted in order, once they are behind the one
+    being searched.
+    """
+    def __init__(self, data, max_depth=MAX_CHAIN_DEPTH):
+        self.data = data
+        self.max_depth = max_depth
+        self.heads = {}
+        self.previous = [-1] * len(data)
+
+    def insert(self, position):
+        key = self.data[position:position + MIN_MATCH_LENGTH]
+        self.previous[position] = self.heads.get(key, -1)
+        self.heads[key] = position
+
+    def longest_match(self, position):
+        data = self.data
+        max_length = min(MAX_MATCH_LENGTH, len(data) - position)
+        if max_length < MIN_MATCH_LENGTH:
+            return 0, 0
+
+        best_length = 0
+        best_distance = 0
+        window_start = position - WINDOW_SIZE
+        candidate = self.heads.get(data[position:position + MIN_MATCH_LENGTH], -1)
+        depth = self.max_depth
+        while candidate >= 0 and candidate >= window_start and depth > 0:
+            distance = position - candidate
+            if distance >= MIN_MATCH_DISTANCE \
+                    and data[candidate + best_length] == data[position + best_length]:
+                length = MIN_MATCH_LENGTH
+                while length < max_length and data[candidate + length] == data[position + length]:
+                    length += 1
+                if length > best_length:
+                    best_length = length
+                    best_distance = distance
+                    if length == max_length:
+                        break
+            candidate = self.previous[candidate]
+            depth -= 1
+        return best_length, best_distance
 
 
-def search_repeated_bytes(data, position, size):
+def greedy_parse(data):
+    size = len(data)
+    chain = HashChain(data)
+    tokens = []
+    position = 0
+    while position < size:
+        length, distance = chain.longest_match(position)
+        if length < MIN_MATCH_LENGTH:
+            length = 1
+            distance = 0
+        for i in range(position, min(position + length, size - MIN_MATCH_LENGTH + 1)):
+            chain.insert(i)
+        tokens.append((length, distance))
+        position += length
+    return tokens
+
+
+def optimal_parse(data):
     """
-    This was also taken from NLZ-Advance
-    and optimized for python
+    Chooses the tokens that take the least amount of bits among the
+    matches the hash chain finds.
+    A literal costs 9 bits and a match costs 17, no matter its length or
+    distance, so knowing the longest match at every position is enough:
+    every shorter length is available at the same distance.
+    Only MAX_CHAIN_DEPTH candidates are looked at for each position, so
+    the result is near-optimal under that limit, not always the smallest.
     """
-    if position < 3 or (size - position) < 3:
-        return 0, 0
-    elif position >= size:
-        return -1, 0
-
-    result = None
-    for i in range(3, 19):
-        f_res = data.find(data[position:position + 1 + i], max(0, position - 0x1000), position)
-        if f_res != -1:
-            result = (i, (position - f_res))
+    size = len(data)
+    chain = HashChain(data)
+    matches = [None] * size
+    for position in range(size):
+        matches[position] = chain.longest_match(position)
+        if position <= size - MIN_MATCH_LENGTH:
+            chain.insert(position)
+
+    cost = [0] * (size + 1)
+    choice = [1] * size
+    for position in range(size - 1, -1, -1):
+        best_cost = cost[position + 1] + 9
+        best_length = 1
+        longest, _ = matches[position]
+        for length in range(MIN_MATCH_LENGTH, longest + 1):
+            length_cost = cost[position + length] + 17
+            if length_cost < best_cost:
+                best_cost = length_cost
+                best_length = length
+        cost[position] = best_cost
+        choice[position] = best_length
+
+    tokens = []
+    position = 0
+    while position < size:
+        length = choice[position]
+        if length == 1:
+            tokens.append((1, 0))
         else:
-            break
-    if result is None:
-        return 0, 0
-    else:
-        return result
+            tokens.append((length, matches[position][1]))
+        position += length
+    return tokens
 
 
-def compress(data):
+def compress(data, optimal=False):
     """
     And this too!
     Thanks Nintenlord!
+    Matches are found with a hash chain over the 0x1000 bytes window.
+    With optimal set the output is near-optimal under the chain limit
+    (see optimal_parse), at the cost of looking up a match at every position.
     """
+    data = bytes(data)
     size = len(data)
-    position = 0
-    compressed_data = b'\x10' + size.to_bytes(3, 'little')
+    tokens = optimal_parse(data) if optimal else greedy_parse(data)
 
-    while position < size:
+    compressed_data = bytearray(b'\x10')
+    compressed_data += size.to_bytes(3, 'little')
+    position = 0
+    for block_start in range(0, len(tokens), 8):
+        flags_index = len(compressed_data)
+        compressed_data.append(0)
         blocks_compress_flags = 0
-        block_data = b''
-        i = 0
-        while i < 8 and position < size:
-            search_result = search_repeated_bytes(data, position, size)
-            if search_result[0] > 2:
-                block_data += (((search_result[0] - 3) << 12) |
-                               (search_result[1] - 1)).to_bytes(2, 'big')
-                position += search_result[0]
-
+        for i, (length, distance) in enumerate(tokens[block_start:block_start + 8]):
+            if length >= MIN_MATCH_LENGTH:
+                compressed_data += (((length - 3) << 12) | (distance - 1)).to_bytes(2, 'big')
                 blocks_compress_flags |= 1 << (7 - i)
-            elif search_result[0] >= 0:
-                block_data += data[position:position + 1]
-                position += 1
             else:
-                break
-            i += 1
-
-        compressed_data += blocks_compress_flags.to_bytes(1, 'little') + block_data
+                compressed_data.append(data[position])
+            position += length
+        compressed_data[flags_index] = blocks_compress_flags
 
     compressed_data += b'\x00' * (0, 3, 2, 1)[len(compressed_data) % 4]
 
-    return compressed_data
+    return bytes(compressed_data)
+
+
+# Mapped rom of each worker process of decompress_many, so the rom is never sent to it.
+# It stays open for the life of the worker and is unmapped when it exits.
+_worker_rom = None
+
 
+def _map_rom(filename):
+    with open(filename, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
+
+def _set_worker_rom(rom_filename):
+    global _worker_rom
+    _worker_rom = _map_rom(rom_filename)
+
+
+def _decompress_or_none(rom, offset, skip_invalid):
+    try:
+        return decompress(rom, offset)
+    except (InvalidLz77Data, IndexError):
+        if skip_invalid:
+            return None
+        raise
+
+
+def _decompress_from_worker_rom(offset, skip_invalid):
+    return _decompress_or_none(_worker_rom, offset, skip_invalid)
+
+
+def decompress_many(rom_filename, offsets, max_workers=None, skip_invalid=False):
+    """
+    Decompresses the data at every offset of the rom in a pool of processes.
+    Every process maps the rom file instead of receiving a copy of it.
+    The results come in the same order as the offsets. With skip_invalid,
+    the result of an offset without valid data is None instead of raising.
+    """
+    offsets = list(offsets)
+    if max_workers == 1 or len(offsets) < 2:
+        with _map_rom(rom_filename) as rom_map:
+            return [_decompress_or_none(rom_map, offset, skip_invalid) for offset in offsets]
+    with ProcessPoolExecutor(max_workers, initializer=_set_worker_rom, initargs=(rom_filename,)) as executor:
+        return list(executor.map(_decompress_from_worker_rom, offsets, itertools.repeat(skip_invalid)))
+
+
+def compress_many(blobs, optimal=False, max_workers=None):
+    """
+    Compresses every blob in a pool of processes.
+    The results come in the same order as the blobs.
+    """
+    blobs = [bytes(blob) for blob in blobs]
+    if len(blobs) < 2:
+        return [compress(blob, optimal) for blob in blobs]
+    with ProcessPoolExecutor(max_workers) as executor:
+        return list(executor.map(compress, blobs, itertools.repeat(optimal)))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the lz77 module.
+No ROM is needed: the corpora are generated from fixed seeds, imitating
+the kind of data the game compresses. The checks are in tests/test_lz77.py.
+
+    python -m mapqeditorq.game.lz77_benchmark
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from mapqeditorq.game import lz77
+
+
+def make_tileset_corpus(seed=0, tiles=512):
+    """4bpp tileset: empty, repeated, patterned and noisy 8x8 tiles."""
+    rng = random.Random(seed)
+    base_tiles = [bytes(32)]
+    for _ in range(24):
+        colors = rng.sample(range(16), 3)
+        if rng.random() < 0.5:
+            # Horizontal gradient-like pattern
+            row = bytes(colors[(x // 3) % 3] | (colors[(x // 3 + 1) % 3] << 4) for x in range(4))
+            tile = b''.join(row[y % 4:] + row[:y % 4] for y in range(8))
+        else:
+            tile = bytes(rng.choice(colors) | (rng.choice(colors) << 4) for _ in range(32))
+        base_tiles.append(tile)
+
+    data = bytearray()
+    for _ in range(tiles):
+        r = rng.random()
+        if r < 0.25:
+            data += base_tiles[0]
+        elif r < 0.85:
+            data += rng.choice(base_tiles)
+        else:
+            data += bytes(rng.randrange(256) for _ in range(32))
+    return bytes(data)
+
+
+def make_layer_corpus(seed=1, wide=64, high=64):
+    """Layer tilemap: u16 block numbers, filled regions with some details."""
+    rng = random.Random(seed)
+    cells = [rng.choice((0x1, 0x2, 0x40)) for _ in range(wide)]
+    data = bytearray()
+    for _ in range(high):
+        row = list(cells)
+        for _ in range(rng.randrange(6)):
+            start = rng.randrange(wide)
+            block = rng.randrange(0x300)
+            for x in range(start, min(wide, start + rng.randrange(1, 8))):
+                row[x] = block + (x - start) % 2
+        for block in row:
+            data += block.to_bytes(2, 'little')
+        if rng.random() < 0.2:
+            cells = [rng.choice((0x1, 0x2, 0x40)) for _ in range(wide)]
+    return bytes(data)
+
+
+def make_behaviours_corpus(seed=2, blocks=0x800):
+    """Blocks behaviours table: u16 values, mostly a few common ones in runs."""
+    rng = random.Random(seed)
+    common_values = (0x0, 0x1, 0x26, 0x2a, 0x52)
+    data = bytearray()
+    value = 0
+    for _ in range(blocks):
+        if rng.random() < 0.3:
+            value = rng.choice(common_values) if rng.random() < 0.9 else rng.randrange(0x10000)
+        data += value.to_bytes(2, 'little')
+    return bytes(data)
+
+
+CORPORA = (
+    ('tileset', make_tileset_corpus),
+    ('layer', make_layer_corpus),
+    ('behaviours', make_behaviours_corpus),
+)
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best, result
+
+
+def run_benchmark(repeat=3, out=sys.stdout):
+    row = '{0:<12}{1:>8}{2:>14}{3:>14}{4:>14}{5:>14}\n'
+    out.write(row.format('corpus', 'size', 'ratio', 'compress', 'optimal', 'decompress'))
+    for name, make_corpus in CORPORA:
+        data = make_corpus()
+        size_mb = len(data) / (1024 * 1024)
+        compress_time, compressed = best_time(lambda: lz77.compress(data), repeat)
+        optimal_time, optimal = best_time(lambda: lz77.compress(data, True), repeat)
+        decompress_time, _ = best_time(lambda: lz77.decompress(compressed), repeat)
+        out.write(row.format(
+            name,
+            len(data),
+            '{0:.3f}/{1:.3f}'.format(len(compressed) / len(data), len(optimal) / len(data)),
+            '{0:.2f} MB/s'.format(size_mb / compress_time),
+            '{0:.2f} MB/s'.format(size_mb / optimal_time),
+            '{0:.2f} MB/s'.format(size_mb / decompress_time),
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the LZ77 codec.')
+    parser.add_argument('--repeat', type=int, default=3, help='times each benchmark is run')
+    args = parser.parse_args(argv)
+
+    run_benchmark(args.repeat)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
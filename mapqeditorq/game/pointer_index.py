@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+
+class PointerIndex:
+    """
+    Every aligned word of the rom that looks like a pointer to the rom,
+    sorted by the address it points to.
+    Addresses are rom offsets, not masked pointers.
+    """
+    MAGIC = b'MQPI'
+    HEADER_SIZE = 28  # magic, rom sha1, amount of pointers
+
+    def __init__(self, targets, referrers):
+        self.targets = targets
+        self.referrers = referrers
+
+    @classmethod
+    def build(cls, rom):
+        rom_size = len(rom)
+        words = np.frombuffer(rom, dtype='<u4', count=rom_size // 4)
+        is_pointer = (words >= 0x8000000) & (words < 0x8000000 + rom_size)
+        referrers = np.flatnonzero(is_pointer).astype('<u4') * 4
+        targets = words[is_pointer] - 0x8000000
+        order = np.argsort(targets, kind='stable')
+        return cls(targets[order].astype('<u4'), referrers[order])
+
+    @classmethod
+    def load(cls, filename, rom_hash):
+        """Returns None if there is no index for the rom in the file."""
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'rb') as f:
+            header = f.read(cls.HEADER_SIZE)
+            if len(header) != cls.HEADER_SIZE or header[:4] != cls.MAGIC or header[4:24] != rom_hash:
+                return None
+            amount = int.from_bytes(header[24:28], 'little')
+            contents = np.fromfile(f, dtype='<u4')
+        if len(contents) != amount * 2:
+            return None
+        return cls(contents[:amount], contents[amount:])
+
+    def save(self, filename, rom_hash):
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(self.MAGIC + rom_hash + len(self.targets).to_bytes(4, 'little'))
+            self.targets.tofile(f)
+            self.referrers.tofile(f)
+        os.replace(tmp_filename, filename)
+
+    def get_referrers(self, target):
+        return self.get_referrers_in_range(target, target + 1)
+
+    def get_referrers_in_range(self, start, end):
+        """Addresses of the words pointing somewhere between start and end (not included)."""
+        first = np.searchsorted(self.targets, start, side='left')
+        last = np.searchsorted(self.targets, end, side='left')
+        return sorted(int(referrer) for referrer in self.referrers[first:last])
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import struct
+
+import numpy as np
+
 #                   (Signed?, Length)
 DATA_TYPES = {'u8': (False, 1),
               's8': (True, 1),
@@ -9,8 +13,47 @@ DATA_TYPES = {'u8': (False, 1),
               's32': (True, 4)
               }
 
+STRUCT_CODES = {'u8': 'B',
+                's8': 'b',
+                'u16': 'H',
+                's16': 'h',
+                'u32': 'I',
+                's32': 'i'
+                }
+
+NUMPY_CODES = {'u8': 'u1',
+               's8': 'i1',
+               'u16': '<u2',
+               's16': '<i2',
+               'u32': '<u4',
+               's32': '<i4'
+               }
+
+
+class StructureMeta(type):
+    """Gives each structure class slots for its fields and a precompiled struct.Struct."""
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            structure_format = namespace.get('FORMAT') or ()
+            namespace['__slots__'] = tuple(attribute for attribute, data_type in structure_format)
+        return super().__new__(mcs, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        if cls.FORMAT is None:
+            cls.STRUCT = None
+            cls.DTYPE = None
+            cls.FIELD_NAMES = ()
+        else:
+            cls.STRUCT = struct.Struct(
+                '<' + ''.join(STRUCT_CODES[data_type] for attribute, data_type in cls.FORMAT)
+            )
+            # Packed like the struct, so arrays can be read straight from the rom
+            cls.DTYPE = np.dtype([(attribute, NUMPY_CODES[data_type]) for attribute, data_type in cls.FORMAT])
+            cls.FIELD_NAMES = tuple(attribute for attribute, data_type in cls.FORMAT)
 
-class StructureBase:
+
+class StructureBase(metaclass=StructureMeta):
     """Example:
     FORMAT = (('value1', 'u8'),
             ('value2', 's16'),
@@ -18,30 +61,76 @@ class StructureBase:
             )"""
     FORMAT = None
 
-    def load_from_bytes(self, data):
-        i = 0
-        for attribute, data_type in type(self).FORMAT:
-            signed, data_size = DATA_TYPES[data_type]
-            setattr(self, attribute, int.from_bytes(data[i:i + data_size], 'little', signed=signed))
-            i += data_size
-        # print(self)
+    def load_from_bytes(self, data, offset=0):
+        self.set_values(type(self).STRUCT.unpack_from(data, offset))
+
+    def set_values(self, values):
+        for attribute, value in zip(type(self).FIELD_NAMES, values):
+            setattr(self, attribute, value)
 
     def to_bytes(self):
-        data = b''
-        for attribute, data_type in type(self).FORMAT:
-            signed, data_size = DATA_TYPES[data_type]
-            data += getattr(self, attribute).to_bytes(data_size, 'little', signed=signed)
-        return data
+        cls = type(self)
+        return cls.STRUCT.pack(*(getattr(self, attribute) for attribute in cls.FIELD_NAMES))
 
     @classmethod
     def size(cls):
-        ret = 0
-        for attribute, data_type in cls.FORMAT:
-            ret += DATA_TYPES[data_type][1]
-        return ret
+        return cls.STRUCT.size
+
+    @classmethod
+    def unpack_from(cls, data, offset=0):
+        struct_obj = cls()
+        struct_obj.load_from_bytes(data, offset)
+        return struct_obj
+
+    @classmethod
+    def unpack_array(cls, data, offset, length):
+        # Decodes the whole array with a single iter_unpack
+        array_data = memoryview(data)[offset:offset + length * cls.STRUCT.size]
+        array = []
+        for values in cls.STRUCT.iter_unpack(array_data):
+            struct_obj = cls()
+            struct_obj.set_values(values)
+            array.append(struct_obj)
+        return array
+
+    @classmethod
+    def as_numpy_array(cls, data, offset, length):
+        """Structured array over data, without copying it. Fields are indexed by name."""
+        return np.frombuffer(data, dtype=cls.DTYPE, count=length, offset=offset)
 
     def __repr__(self):
         ret = type(self).__name__ + ' {'
         for attribute, data_type in type(self).FORMAT:
             ret += ' {0} {1}: {2},'.format(data_type, attribute, hex(getattr(self, attribute)))
         return ret + '}'
+
+
+class LazyStructArray:
+    """Array of structures over a buffer. Each structure is decoded the first time it is accessed."""
+    def __init__(self, StructClass, data, offset, length):
+        self.StructClass = StructClass
+        # Only the bytes are copied, so no reference to data (maybe the mapped rom) is kept
+        self.data = bytes(memoryview(data)[offset:offset + length * StructClass.size()])
+        self.offset = 0
+        self.items = [None] * length
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        struct_obj = self.items[index]
+        if struct_obj is None:
+            if index < 0:
+                index += len(self.items)
+            struct_obj = self.StructClass.unpack_from(self.data, self.offset + index * self.StructClass.size())
+            self.items[index] = struct_obj
+        return struct_obj
+
+    def __setitem__(self, index, value):
+        self.items[index] = value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
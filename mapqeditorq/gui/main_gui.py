@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import logging
 import os
 import sys
 import time
@@ -11,7 +12,7 @@ from .editor_ui import Ui_MainWindow
 from .new_project_dialog import NewProjectDialog
 from ..mqeq_logic import common
 from ..mqeq_logic.main_mqeq_handler import MainMqeqHandler
-from .tilemap_scene import TilemapScene
+from .tilemap_scene import TilemapScene, BlocksMapScene
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -52,7 +53,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.layer2_button.clicked.connect(lambda: self.select_layer(1))
 
         # Setup Map Layers tab
-        self.map_layer_scene = TilemapScene(
+        self.map_layer_scene = BlocksMapScene(
             16, clicked_event=self.map_clicked, clicked_dragged_event=self.map_clicked
         )
         self.ui.map_layer_view.setScene(self.map_layer_scene)
@@ -229,11 +230,14 @@ class MainWindow(QtWidgets.QMainWindow):
     def import_blocks(self):
         filename = self.open_file_dialog('Import blocks')
         if filename:
-            self.handler.import_blocks(filename)
-            self.print_block_preview()
-            self.print_blocks_img()
-            self.print_map()
-            self.statusbar_show('Blocks imported successfully')
+            try:
+                self.handler.import_blocks(filename)
+                self.print_block_preview()
+                self.print_blocks_img()
+                self.print_map()
+                self.statusbar_show('Blocks imported successfully')
+            except common.MqeqError as e:
+                self.error_message('Error importing blocks', str(e))
 
     def export_blocks_behaviour(self):
         filename = self.save_file_dialog('Export blocks behaviour')
@@ -257,17 +261,19 @@ class MainWindow(QtWidgets.QMainWindow):
     def import_map_layer(self):
         filename = self.open_file_dialog('Import map layer')
         if filename:
-            self.handler.import_map_layer(filename)
-            self.print_map()
-            self.statusbar_show('Map layer imported successfully')
+            try:
+                self.handler.import_map_layer(filename)
+                self.print_map()
+                self.statusbar_show('Map layer imported successfully')
+            except common.MqeqError as e:
+                self.error_message('Error importing map layer', str(e))
 
     def import_tileset(self):
         self.setEnabled(False)
         filename = self.open_file_dialog('Open Image file', 'All files (*)')
         if filename:
             try:
-                self.handler.replace_selected_tileset(filename)
-                self.print_all()
+                self.print_redrawn_blocks(self.handler.replace_selected_tileset(filename))
                 self.statusbar_show('Tileset imported successfully')
             except common.MqeqError as e:
                 self.error_message('Error importing tileset', str(e))
@@ -345,6 +351,17 @@ class MainWindow(QtWidgets.QMainWindow):
         self.print_selected_palette()
         self.print_change_tileset_preview()
 
+    def print_redrawn_blocks(self, block_nums):
+        # Only the blocks drawn again are updated in the map and in the blocks image
+        for block_num in block_nums:
+            self.layer_blocks_scene.update_tile_image(block_num, self.handler.get_block_image(block_num))
+        self.map_layer_scene.invalidate_blocks(block_nums)
+        self.print_tilesets()
+        self.print_tile_preview()
+        self.print_block_preview()
+        self.print_selected_palette()
+        self.print_change_tileset_preview()
+
     def select_layer(self, layer_num):
         self.handler.select_layer(layer_num)
         self.print_all()
@@ -371,13 +388,13 @@ class MainWindow(QtWidgets.QMainWindow):
             button = event.button()
             if button == QtCore.Qt.LeftButton:
                 self.handler.paint_map_tile(tile_num)
-                self.print_map()
+                self.map_layer_scene.update_tile(tile_num)
             elif button == QtCore.Qt.RightButton:
                 self.handler.select_block_at(tile_num)
                 self.update_blocks_data()
 
     def print_map(self):
-        self.map_layer_scene.set_image(self.handler.get_map_image())
+        self.map_layer_scene.set_tilemap(*self.handler.get_map_tilemap())
 
     def select_block(self, block_num):
         self.handler.select_block(block_num)
@@ -459,8 +476,10 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.handler.paint_block(block_part, flip_x, flip_y)
 
                 self.print_block_preview()
-                self.print_blocks_img()
-                self.print_map()
+                self.layer_blocks_scene.update_tile_image(
+                    self.handler.get_selected_block(), self.handler.get_block_image()
+                )
+                self.map_layer_scene.invalidate_blocks([self.handler.get_selected_block()])
             elif button == QtCore.Qt.RightButton:
                 flip_x, flip_y = self.handler.select_tile_at_block_part(block_part)
                 self.ui.flipX_checkbox.setChecked(flip_x != 0)
@@ -565,8 +584,7 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         if filename:
             try:
-                self.handler.load_palette_from_image(filename)
-                self.print_all()
+                self.print_redrawn_blocks(self.handler.load_palette_from_image(filename))
                 self.statusbar_show('Palette imported successfully')
             except common.MqeqError as e:
                 self.error_message('Error loading pal', str(e))
@@ -581,10 +599,10 @@ class MainWindow(QtWidgets.QMainWindow):
         r = self.ui.red_spinbox.value()
         g = self.ui.green_spinbox.value()
         b = self.ui.blue_spinbox.value()
-        self.handler.modify_selected_color((r, g, b))
+        block_nums = self.handler.modify_selected_color((r, g, b))
         self.ui.save_color_button.setEnabled(False)
 
-        self.print_all()
+        self.print_redrawn_blocks(block_nums)
         self.setEnabled(True)
 
     def print_change_tileset_preview(self):
@@ -598,6 +616,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
 def main():
+    logging.basicConfig(format='%(levelname)s: %(message)s')
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
     window.show()
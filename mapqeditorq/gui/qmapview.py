@@ -1,24 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from PyQt5 import QtCore, QtWidgets
+from math import ceil
 
+import numpy as np
+from PyQt5 import QtCore, QtGui, QtWidgets
 
-class QMapPixmap(QtWidgets.QGraphicsObject):
+from mapqeditorq.maps.map_layer import render_cells
+
+
+class QClickableItem(QtWidgets.QGraphicsObject):
     clicked = QtCore.pyqtSignal(QtWidgets.QGraphicsSceneMouseEvent)
     click_dragged = QtCore.pyqtSignal(QtWidgets.QGraphicsSceneMouseEvent)
     click_release = QtCore.pyqtSignal(QtWidgets.QGraphicsSceneMouseEvent)
 
-    def __init__(self, pixmap):
-        super(QMapPixmap, self).__init__()
-        self.set_pixmap(pixmap)
+    def __init__(self):
+        super(QClickableItem, self).__init__()
         self.button = None
 
-    def boundingRect(self):
-        return QtCore.QRectF(self.pixmap.rect())
-
-    def set_pixmap(self, pixmap):
-        self.pixmap = pixmap
-
     def mousePressEvent(self, event):
         self.button = event.button()
         self.clicked.emit(event)
@@ -32,6 +30,132 @@ class QMapPixmap(QtWidgets.QGraphicsObject):
         self.click_release.emit(event)
         self.button = None
 
+
+def to_rgb_array(img):
+    """Pixels of a PIL image (or an array of shape (h, w, 3)) as an RGB array."""
+    if isinstance(img, np.ndarray):
+        return img
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img)
+
+
+class RgbBuffer:
+    """
+    RGB pixels in a NumPy array and a QImage using the same memory,
+    so writing to the array changes the image without any conversion.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.array = np.zeros((height, width, 3), dtype=np.uint8)
+        self.qimage = QtGui.QImage(
+            self.array.data, width, height, self.array.strides[0], QtGui.QImage.Format_RGB888
+        )
+
+    def write(self, img, x=0, y=0):
+        """Copies img into the buffer at (x, y). Returns the modified QRect."""
+        pixels = to_rgb_array(img)
+        h, w, _ = pixels.shape
+        self.array[y:y + h, x:x + w] = pixels
+        return QtCore.QRect(x, y, w, h)
+
+
+class QMapImage(QClickableItem):
+    """Item drawing an RgbBuffer. Only the exposed rect of the buffer is painted."""
+    def __init__(self, width, height):
+        super(QMapImage, self).__init__()
+        self.buffer = RgbBuffer(width, height)
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QtCore.QRectF(0, 0, self.buffer.width, self.buffer.height)
+
+    def get_size(self):
+        return self.buffer.width, self.buffer.height
+
+    def write(self, img, x=0, y=0):
+        self.update(QtCore.QRectF(self.buffer.write(img, x, y)))
+
+    def paint(self, painter, option, widget):
+        rect = option.exposedRect.intersected(self.boundingRect()).toAlignedRect()
+        painter.drawImage(rect, self.buffer.qimage, rect)
+
+
+class QBlocksMap(QClickableItem):
+    """
+    Draws a tilemap of blocks without building an image of the whole map.
+    Only the cells inside the exposed rect are painted, gathered from the images
+    of their blocks into a single image.
+    """
+    MAX_CELL_UPDATES = 256
+
+    def __init__(self, tile_size):
+        super(QBlocksMap, self).__init__()
+        self.tile_size = tile_size
+        self.tilemap = None
+        self.tiles_wide = 0
+        self.tiles_high = 0
+        self.blocks_imgs = None
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return QtCore.QRectF(0, 0, self.tiles_wide * self.tile_size, self.tiles_high * self.tile_size)
+
+    def set_tilemap(self, tilemap, tiles_wide, tiles_high, blocks_imgs):
+        """
+        tilemap is the array of block numbers of each cell and blocks_imgs
+        the array of shape (blocks, tile_size, tile_size, 3) with the images of the blocks.
+        Both are kept by reference, so cells and blocks modified in place are drawn
+        after calling update_cell or invalidate_blocks.
+        """
+        self.prepareGeometryChange()
+        self.tilemap = tilemap
+        self.tiles_wide = tiles_wide
+        self.tiles_high = tiles_high
+        self.blocks_imgs = blocks_imgs
+        self.invalidate_blocks()
+
+    def invalidate_blocks(self, block_nums=None):
+        """
+        Draws again the cells with any of the blocks (every cell if None).
+        Only the rects of those cells are repainted.
+        """
+        if block_nums is None:
+            self.update()
+            return
+        cells_amount = min(len(self.tilemap), self.tiles_wide * self.tiles_high)
+        cells = np.flatnonzero(np.isin(self.tilemap[:cells_amount], block_nums))
+        if len(cells) > self.MAX_CELL_UPDATES:
+            # One rect around all of them instead of a region of many small rects
+            xs = cells % self.tiles_wide
+            ys = cells // self.tiles_wide
+            self.update(QtCore.QRectF(
+                int(xs.min()) * self.tile_size, int(ys.min()) * self.tile_size,
+                (int(xs.max()) - int(xs.min()) + 1) * self.tile_size,
+                (int(ys.max()) - int(ys.min()) + 1) * self.tile_size
+            ))
+        else:
+            for cell in cells.tolist():
+                self.update_cell(cell)
+
+    def update_cell(self, cell):
+        x = (cell % self.tiles_wide) * self.tile_size
+        y = (cell // self.tiles_wide) * self.tile_size
+        self.update(QtCore.QRectF(x, y, self.tile_size, self.tile_size))
+
     def paint(self, painter, option, widget):
-        painter.drawPixmap(QtCore.QPoint(0, 0), self.pixmap)
+        if self.tilemap is None:
+            return
+        rect = option.exposedRect.intersected(self.boundingRect())
+        first_x = max(0, int(rect.left()) // self.tile_size)
+        first_y = max(0, int(rect.top()) // self.tile_size)
+        last_x = min(self.tiles_wide, ceil(rect.right() / self.tile_size))
+        last_y = min(self.tiles_high, ceil(rect.bottom() / self.tile_size))
+        if first_x >= last_x or first_y >= last_y:
+            return
 
+        pixels = render_cells(self.tilemap, self.tiles_wide, self.blocks_imgs, first_x, first_y, last_x, last_y)
+        h, w, _ = pixels.shape
+        img_qt = QtGui.QImage(pixels.data, w, h, pixels.strides[0], QtGui.QImage.Format_RGB888)
+        painter.drawImage(first_x * self.tile_size, first_y * self.tile_size, img_qt)
@@ -1,6 +1,5 @@
 
 from PyQt5 import QtWidgets, QtGui, QtCore
-from PIL import ImageQt
 
 from mapqeditorq.gui import qmapview
 
@@ -10,6 +9,7 @@ class TilemapScene(QtWidgets.QGraphicsScene):
         super(TilemapScene, self).__init__()
 
         self.pixmap = None
+        self.selection = None
         self.tiles_wide = None
         self.tile_size = tile_size
         self.clicked_event = clicked_event
@@ -19,21 +19,28 @@ class TilemapScene(QtWidgets.QGraphicsScene):
             self.set_image(img)
 
     def set_image(self, img):
-        img_qt = ImageQt.ImageQt(img.convert('RGBA'))
-        pixmap = QtGui.QPixmap.fromImage(img_qt)
-        self.set_pixmap(pixmap)
-
-    def set_pixmap(self, pixmap):
-        if self.pixmap is None or pixmap.width() != self.pixmap.pixmap.width():
-            self.initialize_pixmap(pixmap)
-        else:
-            self.pixmap.set_pixmap(pixmap)
-        self.tiles_wide = pixmap.width() // self.tile_size
-        self.update()
-
-    def initialize_pixmap(self, pixmap):
+        # The pixels are copied into the buffer of the current item, which is only
+        # created again if the size of the image changes
+        self.hide_selection()
+        pixels = qmapview.to_rgb_array(img)
+        h, w, _ = pixels.shape
+        if not isinstance(self.pixmap, qmapview.QMapImage) or self.pixmap.get_size() != (w, h):
+            self.initialize_item(qmapview.QMapImage(w, h))
+            self.setSceneRect(self.pixmap.boundingRect())
+        self.pixmap.write(pixels)
+        self.tiles_wide = w // self.tile_size
+
+    def update_image_region(self, x, y, img):
+        self.pixmap.write(img, x, y)
+
+    def update_tile_image(self, tile_num, img):
+        x = (tile_num % self.tiles_wide) * self.tile_size
+        y = (tile_num // self.tiles_wide) * self.tile_size
+        self.update_image_region(x, y, img)
+
+    def initialize_item(self, item):
         self.clear()
-        self.pixmap = qmapview.QMapPixmap(pixmap)
+        self.pixmap = item
         self.addItem(self.pixmap)
         if self.clicked_event is not None:
             self.pixmap.clicked.connect(self.clicked_event)
@@ -44,7 +51,8 @@ class TilemapScene(QtWidgets.QGraphicsScene):
         pos = event.pos()
         x = int(pos.x())
         y = int(pos.y())
-        if x < 0 or y < 0 or x >= self.pixmap.pixmap.width() or y >= self.pixmap.pixmap.height():
+        rect = self.pixmap.boundingRect()
+        if x < 0 or y < 0 or x >= rect.width() or y >= rect.height():
             return -1
 
         tile_x = x // self.tile_size
@@ -57,11 +65,36 @@ class TilemapScene(QtWidgets.QGraphicsScene):
         x = (tile_num % self.tiles_wide) * self.tile_size
         y = (tile_num // self.tiles_wide) * self.tile_size
 
-        drawer = QtGui.QPainter(self.pixmap.pixmap)
-        drawer.setPen(color)
-        drawer.drawRect(x, y, self.tile_size, self.tile_size)
-        drawer.end()
+        # The selection is an item over the image, so the image does not have to be drawn again
+        if self.selection is None:
+            self.selection = QtWidgets.QGraphicsRectItem()
+            self.selection.setZValue(1)
+            self.addItem(self.selection)
+        self.selection.setPen(QtGui.QPen(color))
+        self.selection.setRect(x, y, self.tile_size, self.tile_size)
+        self.selection.show()
+
+    def hide_selection(self):
+        if self.selection is not None:
+            self.selection.hide()
 
     def clear(self):
         self.pixmap = None
-        super(TilemapScene, self).clear()
\ No newline at end of file
+        self.selection = None
+        super(TilemapScene, self).clear()
+
+
+class BlocksMapScene(TilemapScene):
+    """Scene for a tilemap of blocks, drawn with a QBlocksMap instead of an image of the whole map."""
+    def set_tilemap(self, tilemap, tiles_wide, tiles_high, blocks_imgs):
+        if not isinstance(self.pixmap, qmapview.QBlocksMap):
+            self.initialize_item(qmapview.QBlocksMap(self.tile_size))
+        self.pixmap.set_tilemap(tilemap, tiles_wide, tiles_high, blocks_imgs)
+        self.tiles_wide = tiles_wide
+        self.setSceneRect(self.pixmap.boundingRect())
+
+    def update_tile(self, tile_num):
+        self.pixmap.update_cell(tile_num)
+
+    def invalidate_blocks(self, block_nums=None):
+        self.pixmap.invalidate_blocks(block_nums)
\ No newline at end of file
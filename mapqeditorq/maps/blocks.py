@@ -1,23 +1,60 @@
 
 from math import ceil
+import numpy as np
 from PIL import Image
 
+from ..game import gba_image
 from . import common
 
 
-class Blocks(common.MapDataObjectBase):
-    POSITIONS = (
-        (0, 0),
-        (8, 0),
-        (0, 8),
-        (8, 8)
-    )
+def decode_blocks_data(blocks_data):
+    """
+    Splits the halfwords of blocks_data, with shape (blocks, 4), into
+    an array of shape (blocks, 4, 4) with a [tile_num, flip_x, flip_y, palette]
+    entry for each of the 4 tiles of every block.
+    """
+    blocks_data = np.asarray(blocks_data, dtype=np.intp)
+    return np.stack((
+        blocks_data & 0x3ff,
+        (blocks_data >> 10) & 1,
+        (blocks_data >> 11) & 1,
+        blocks_data >> 12
+    ), axis=-1)
+
+
+def encode_block_part(tile_num, flip_x, flip_y, palette):
+    return tile_num | (flip_x << 10) | (flip_y << 11) | (palette << 12)
+
+
+def render_blocks(blocks_data, tiles, palettes_lut):
+    """
+    Draws every block at once.
+    blocks_data has shape (blocks, 4) with the halfwords of the 4 tiles of every block,
+    tiles has shape (tiles, 8, 8) with the color indexes and palettes_lut has shape (16, 16, 3).
+    Returns an array of shape (blocks, 16, 16, 3).
+    """
+    blocks_data = decode_blocks_data(blocks_data).reshape(-1, 4, 4)
+    tile_pixels = tiles[blocks_data[..., 0]]
+    flip_x = blocks_data[..., 1, None, None] != 0
+    flip_y = blocks_data[..., 2, None, None] != 0
+    tile_pixels = np.where(flip_x, tile_pixels[..., :, ::-1], tile_pixels)
+    tile_pixels = np.where(flip_y, tile_pixels[..., ::-1, :], tile_pixels)
+    rgb = palettes_lut[blocks_data[..., 3, None, None], tile_pixels]
+    # The 4 tiles are ordered left to right, top to bottom
+    amount = len(blocks_data)
+    return rgb.reshape(amount, 2, 2, 8, 8, 3).transpose(0, 1, 3, 2, 4, 5).reshape(amount, 16, 16, 3)
+
 
+class Blocks(common.MapDataObjectBase):
     def __init__(self):
         super().__init__()
+        # Halfwords of the 4 tiles of each block, shape (blocks, 4)
         self.data = None
         self.imgs = None
+        self.imgs_array = None
         self.amount = None
+        # (palette, tile_num) -> numbers of the blocks using that tile with that palette
+        self.users_index = None
 
         self.behaviours = BlocksBehaviour()
 
@@ -27,60 +64,97 @@ class Blocks(common.MapDataObjectBase):
         if self.data is not None and not self.was_modified():
             self.modified = True
         self.amount = int(ceil(len(data) / 8))
-        self.data = [None] * self.amount
-        for i in range(self.amount):
-            block_raw_data = data[i * 8:(i + 1) * 8]
-            block_data = [None, None, None, None]
-            for j in range(4):
-                num = int.from_bytes(block_raw_data[j * 2:(j + 1) * 2], 'little')
-                palette = num >> 12
-                flip_x = (num >> 10) & 1
-                flip_y = (num >> 11) & 1
-                tile_num = num & 0x3ff
-                block_data[j] = [tile_num, flip_x, flip_y, palette]
-            self.data[i] = block_data
+        self.data = common.halfwords_from_bytes(data, self.amount * 4).reshape(self.amount, 4)
+        self.build_users_index()
+
+    def get_tile_nums(self):
+        return self.data & 0x3ff
+
+    def get_palettes(self):
+        return self.data >> 12
+
+    def build_users_index(self):
+        self.users_index = {}
+        tile_nums = self.get_tile_nums().tolist()
+        palettes = self.get_palettes().tolist()
+        for block_num in range(self.amount):
+            for tile_num, palette in zip(tile_nums[block_num], palettes[block_num]):
+                self.users_index.setdefault((palette, tile_num), set()).add(block_num)
+
+    def get_block_users_keys(self, block_num):
+        block_data = self.data[block_num].tolist()
+        return [(num >> 12, num & 0x3ff) for num in block_data]
+
+    def add_block_to_users_index(self, block_num):
+        for key in self.get_block_users_keys(block_num):
+            self.users_index.setdefault(key, set()).add(block_num)
+
+    def remove_block_from_users_index(self, block_num):
+        for palette, tile_num in self.get_block_users_keys(block_num):
+            users = self.users_index.get((palette, tile_num))
+            if users is not None:
+                users.discard(block_num)
+                if not users:
+                    del self.users_index[(palette, tile_num)]
+
+    def get_blocks_using(self, palettes=None, tile_nums=None):
+        """Numbers of the blocks using any of the tiles with any of the palettes (None means any)."""
+        if palettes is not None:
+            palettes = set(palettes)
+        if tile_nums is not None:
+            tile_nums = set(tile_nums)
+        block_nums = set()
+        for (palette, tile_num), users in self.users_index.items():
+            if (palettes is None or palette in palettes) and (tile_nums is None or tile_num in tile_nums):
+                block_nums |= users
+        return sorted(block_nums)
 
     def get_behaviours_object(self):
         return self.behaviours
 
     def load_imgs(self, map_object, layer_num):
+        self.imgs_array = render_blocks(
+            self.data, map_object.get_layer_tiles(layer_num), map_object.get_palettes_lut()
+        )
         self.imgs = [None] * self.amount
 
-        for i in range(self.amount):
-            self.load_img_of_block(i, map_object, layer_num)
-
     def load_img_of_block(self, block_num, map_object, layer_num):
-        block_data = self.data[block_num]
-        img = common.BASE_TILE_16x16.copy()
-        for i in range(4):
-            pos_x, pos_y = Blocks.POSITIONS[i]
-            tile = map_object.get_tile_img(block_data[i][3], block_data[i][0], layer_num)
-
-            if block_data[i][1]:
-                tile = tile.transpose(Image.FLIP_LEFT_RIGHT)
-            if block_data[i][2]:
-                tile = tile.transpose(Image.FLIP_TOP_BOTTOM)
-
-            img.paste(tile, (pos_x, pos_y, pos_x + 8, pos_y + 8))
-
-        self.imgs[block_num] = img
+        self.redraw_blocks([block_num], map_object, layer_num)
+
+    def redraw_blocks(self, block_nums, map_object, layer_num):
+        if self.imgs_array is None or not block_nums:
+            return
+        self.imgs_array[block_nums] = render_blocks(
+            self.data[block_nums],
+            map_object.get_layer_tiles(layer_num),
+            map_object.get_palettes_lut()
+        )
+        for block_num in block_nums:
+            self.imgs[block_num] = None
 
     def get_block_img(self, block_num):
-        try:
-            return self.imgs[block_num]
-        except IndexError:
+        if block_num >= self.amount:
             return common.BASE_TILE_16x16
+        img = self.imgs[block_num]
+        if img is None:
+            img = Image.frombytes('RGB', (16, 16), self.imgs_array[block_num].tobytes())
+            self.imgs[block_num] = img
+        return img
 
     def set_block_data(self, block_num, block_part, data, map_object, layer_num):
-        self.data[block_num][block_part] = data
+        self.remove_block_from_users_index(block_num)
+        self.data[block_num, block_part] = encode_block_part(*data)
+        self.add_block_to_users_index(block_num)
         self.load_img_of_block(block_num, map_object, layer_num)
         self.modified = True
 
     def get_block_data(self, block_num):
-        return self.data[block_num]
+        return decode_blocks_data(self.data[block_num]).tolist()
 
     def get_full_img(self):
-        return common.draw_img_from_tileset(self.imgs, 8)
+        sheet = gba_image.tiles_to_sheet(self.imgs_array, 8)
+        h, w, _ = sheet.shape
+        return Image.frombytes('RGB', (w, h), sheet.tobytes())
 
     def is_loaded(self):
         return self.data is not None and self.imgs is not None
@@ -94,15 +168,7 @@ class Blocks(common.MapDataObjectBase):
         self.modified = value
 
     def to_bytes(self):
-        raw_data = b''
-        for block_data in self.data:
-            block_raw_data = b''
-            for block_part_data in block_data:
-                tile_num, flip_x, flip_y, pal_num = block_part_data
-                num = tile_num | (flip_x << 10) | (flip_y << 11) | pal_num << 12
-                block_raw_data += num.to_bytes(2, 'little')
-            raw_data += block_raw_data
-        return raw_data
+        return self.data.tobytes()
 
     def is_final(self):
         return self.header.is_final()
@@ -117,7 +183,7 @@ class Blocks(common.MapDataObjectBase):
         return self.behaviours.to_bytes()
 
     def set_behaviour_data(self, raw_data):
-        self.behaviours.load(raw_data)
+        self.behaviours.set_data(raw_data)
 
 
 class BlocksBehaviour(common.MapDataObjectBase):
@@ -132,15 +198,10 @@ class BlocksBehaviour(common.MapDataObjectBase):
             amount = len(data) // 2
         else:
             amount = self.header.get_uncompressed_size() // 2
-        self.data = [None] * amount
-        for i in range(amount):
-            self.data[i] = int.from_bytes(data[2 * i:2 * i + 2], 'little')
+        self.data = common.halfwords_from_bytes(data, amount)
 
     def to_bytes(self):
-        data = b''
-        for halfword in self.data:
-            data += halfword.to_bytes(2, 'little')
-        return data
+        return self.data.tobytes()
 
     def was_modified(self):
         return self.modified
@@ -155,5 +216,5 @@ class BlocksBehaviour(common.MapDataObjectBase):
                 self.modified = True
 
     def get_data(self, block_num):
-        return self.data[block_num]
+        return int(self.data[block_num])
 
@@ -1,6 +1,6 @@
 
 import abc
-from math import ceil
+import numpy as np
 from PIL import Image
 import re
 
@@ -30,43 +30,28 @@ def encode_mapdata_pointer(pointer, final=False):
     return pointer
 
 
-def palette_from_gba_to_rgb(data):
-    rgb_palette = []
-    for i in range(0, len(data), 2):
-        halfword = int.from_bytes(data[i:i + 2], 'little')
-        r = (halfword & 0x1f) << 3
-        g = ((halfword >> 5) & 0x1f) << 3
-        b = ((halfword >> 10) & 0x1f) << 3
-        rgb_palette.extend((r, g, b))
-    return rgb_palette
+def halfwords_from_bytes(data, amount=None):
+    """
+    Copies the little endian halfwords of data into a new array.
+    If amount is given, the array is truncated or padded with zeros to that length.
+    """
+    available = len(data) // 2
+    if amount is None:
+        amount = available
+    halfwords = np.zeros(amount, dtype='<u2')
+    count = min(amount, available)
+    halfwords[:count] = np.frombuffer(data, dtype='<u2', count=count)
+    return halfwords
 
 
-def draw_img_from_tileset(tileset, tiles_wide, img_mode='RGB'):
-    tile_amount = len(tileset)
-    w, h = tileset[0].size
-    total_w = w * tiles_wide
-    tiles_high = ceil(tile_amount / tiles_wide)
-    total_h = h * tiles_high
-    img = Image.new(img_mode, (total_w, total_h))
-    for i in range(tile_amount):
-        x = i % tiles_wide
-        y = i // tiles_wide
-        img.paste(tileset[i], (x * w, y * h, (x + 1) * w, (y + 1) * h))
-    return img
-
-
-def crop_img_in_tiles(img):
-    w, h = img.size
-    tiles_wide = w // 8
-    tiles_high = h // 8
-    tiles = [None] * (tiles_wide * tiles_high)
-
-    c = 0
-    for y in range(0, h, 8):
-        for x in range(0, w, 8):
-            tiles[c] = img.crop((x, y, x + 8, y + 8))
-            c += 1
-    return tiles
+def palette_from_gba_to_rgb(data):
+    """BGR555 colors to an array of shape (colors, 3) with their rgb values."""
+    halfwords = np.frombuffer(data, dtype='<u2', count=len(data) // 2)
+    rgb_palette = np.empty((len(halfwords), 3), dtype=np.uint8)
+    rgb_palette[:, 0] = (halfwords & 0x1f) << 3
+    rgb_palette[:, 1] = ((halfwords >> 5) & 0x1f) << 3
+    rgb_palette[:, 2] = ((halfwords >> 10) & 0x1f) << 3
+    return rgb_palette
 
 
 class MapDataGenericHeader(ParseableStructBase):
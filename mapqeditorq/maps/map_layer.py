@@ -1,9 +1,32 @@
 
-from PIL import Image
+import numpy as np
 
 from . import common
 
 
+def render_cells(layer_data, tiles_wide, blocks_imgs, first_x, first_y, last_x, last_y):
+    """
+    Draws the cells from (first_x, first_y) to (last_x, last_y) (not included)
+    with a single gather of the images of their blocks.
+    blocks_imgs has shape (blocks, 16, 16, 3). Cells with an invalid block, or past
+    the end of layer_data, are black.
+    Returns an array of shape ((last_y - first_y) * 16, (last_x - first_x) * 16, 3).
+    """
+    cells = np.arange(first_y, last_y)[:, None] * tiles_wide + np.arange(first_x, last_x)
+    cells_high, cells_wide = cells.shape
+    block_size = blocks_imgs.shape[1]
+    if len(blocks_imgs) == 0:
+        return np.zeros((cells_high * block_size, cells_wide * block_size, 3), dtype=np.uint8)
+
+    block_nums = np.full(cells.shape, len(blocks_imgs), dtype=np.intp)
+    in_data = cells < len(layer_data)
+    block_nums[in_data] = layer_data[cells[in_data]]
+    invalid = block_nums >= len(blocks_imgs)
+    pixels = blocks_imgs[np.where(invalid, 0, block_nums)]
+    pixels[invalid] = 0
+    return pixels.transpose(0, 2, 1, 3, 4).reshape(cells_high * block_size, cells_wide * block_size, 3)
+
+
 class MapLayer(common.MapDataObjectBase):
     def __init__(self):
         super().__init__()
@@ -14,17 +37,10 @@ class MapLayer(common.MapDataObjectBase):
     def set_data(self, data):
         if self.data is not None and not self.was_modified():
             self.modified = True
-        data_size = len(data) // 2
-        self.data = [None] * data_size
-
-        for i in range(data_size):
-            self.data[i] = int.from_bytes(data[2 * i:2 * (i + 1)], 'little')
+        self.data = common.halfwords_from_bytes(data)
 
     def to_bytes(self):
-        data = b''
-        for block_num in self.data:
-            data += block_num.to_bytes(2, 'little')
-        return data
+        return self.data.tobytes()
 
     def was_modified(self):
         return self.modified
@@ -32,16 +48,6 @@ class MapLayer(common.MapDataObjectBase):
     def set_modified(self, value):
         self.modified = value
 
-    def draw_img(self, blocks, tiles_wide, tiles_high):
-        img = Image.new('RGB', (tiles_wide * 16, tiles_high * 16))
-
-        for i in range(len(self.data)):
-            x = i % tiles_wide
-            y = i // tiles_wide
-            img.paste(blocks.get_block_img(self.data[i]),
-                      (x * 16, y * 16, (x + 1) * 16, (y + 1) * 16))
-        return img
-
     def set_tile(self, tile_num, block_num):
         if self.data[tile_num] != block_num:
             self.data[tile_num] = block_num
@@ -50,4 +56,4 @@ class MapLayer(common.MapDataObjectBase):
                 self.modified = True
 
     def get_block_num_at(self, tile_num):
-        return self.data[tile_num]
+        return int(self.data[tile_num])
@@ -3,6 +3,9 @@
 from ..mqeq_logic.thread_utils import ExceptionRaisingThread
 from ..mqeq_logic.parsers import ParseableStructBase
 from .palettes import Palettes
+from .tilesets import Tileset
+
+import numpy as np
 
 
 class InvalidMap(Exception):
@@ -69,8 +72,6 @@ class Map:
 
         load_data_thread.join()
         load_warps_thread.join()
-        print('scripts:', hex(project.game.get_scripts_array_ptr(index, subindex)))
-        print('warps:', hex(project.game.get_warps_array_ptr(index, subindex)))
 
     def load_layers(self, project):
         self.layers = project.get_map_layers(self.index, self.subindex)
@@ -94,11 +95,14 @@ class Map:
 
         load_layer2_imgs_th.join()
 
-    def draw_layer(self, layer_num):
-        tiles_wide = self.header.get_tiles_wide()
-        tiles_high = self.header.get_tiles_high()
-
-        return self.layers[layer_num].draw_img(self.blocks[layer_num], tiles_wide, tiles_high)
+    def get_layer_tilemap(self, layer_num):
+        """Returns the block numbers of the layer, its size in blocks and the images of its blocks."""
+        return (
+            self.layers[layer_num].data,
+            self.header.get_tiles_wide(),
+            self.header.get_tiles_high(),
+            self.blocks[layer_num].imgs_array
+        )
 
     def get_tile_img(self, pal_num, tile_num, layer_num):
         tileset_offset = 0
@@ -107,6 +111,19 @@ class Map:
             tileset_offset += 1
         return self.tilesets[layer_num + tileset_offset].get_tile(pal_num, tile_num)
 
+    def get_layer_tiles(self, layer_num):
+        # A block's tile number can go past the first tileset of the layer, into the next one
+        tiles = np.zeros((2 * Tileset.MAX_TILES, 8, 8), dtype=np.uint8)
+        for i, tileset in enumerate(self.tilesets[layer_num:layer_num + 2]):
+            if tileset.is_loaded():
+                tileset_tiles = tileset.tiles[:Tileset.MAX_TILES]
+                start = i * Tileset.MAX_TILES
+                tiles[start:start + len(tileset_tiles)] = tileset_tiles
+        return tiles
+
+    def get_palettes_lut(self):
+        return self.palettes.get_palettes_lut()
+
     def get_full_tileset_imgs(self, pal_num, layer_num):
         ret = ()
         for tileset in self.tilesets[layer_num:layer_num + 2]:
@@ -116,6 +133,9 @@ class Map:
     def get_tileset_image(self, pal_num, tilset_num):
         return self.tilesets[tilset_num].get_full_tileset(pal_num)
 
+    def get_tileset_sheet(self, pal_num, tileset_num):
+        return self.tilesets[tileset_num].get_sheet_img(pal_num)
+
     def get_block_img(self, block_num, layer_num):
         return self.blocks[layer_num].get_block_img(block_num)
 
@@ -174,32 +194,65 @@ class Map:
 
     def change_tileset_image(self, tileset_num, img):
         self.tilesets[tileset_num].change_image(img)
-        self.redraw_blocks()
+        return self.redraw_blocks_using_tileset(tileset_num)
 
     def get_palette_image(self, pal_num):
         return self.palettes.get_palette_img(pal_num)
 
+    def get_palette(self, pal_num):
+        return self.palettes.get_palette(pal_num)
+
     def set_palette(self, palette_num, palette):
         self.palettes.set_palette(palette_num, palette)
-        self.redraw_blocks()
+        return self.redraw_blocks_using(palette_num)
 
     def get_color_rgb_values(self, pal_num, color_num):
         return self.palettes.get_color(pal_num, color_num)
 
     def modify_color(self, pal_num, color_num, rgb):
         self.palettes.set_color(pal_num, color_num, rgb)
-        self.redraw_blocks()
+        return self.redraw_blocks_using_color(pal_num, color_num)
 
     def redraw_blocks(self, layer_num=None):
         iterable = ((layer_num,), range(2))[layer_num is None]
         for layer_num in iterable:
             self.blocks[layer_num].load_imgs(self, layer_num)
 
+    def redraw_blocks_using(self, pal_num=None, tile_nums_getter=None):
+        """
+        Redraws only the blocks using the palette (any if None) and any of the tiles
+        returned by tile_nums_getter(layer_num) (any if None).
+        Returns the numbers of the redrawn blocks of each layer.
+        """
+        redrawn = [None, None]
+        palettes = None if pal_num is None else (pal_num,)
+        for layer_num in range(2):
+            tile_nums = None if tile_nums_getter is None else tile_nums_getter(layer_num)
+            block_nums = self.blocks[layer_num].get_blocks_using(palettes, tile_nums)
+            self.blocks[layer_num].redraw_blocks(block_nums, self, layer_num)
+            redrawn[layer_num] = block_nums
+        return redrawn
+
+    def redraw_blocks_using_color(self, pal_num, color_num):
+        def tiles_with_color(layer_num):
+            tiles = self.get_layer_tiles(layer_num)
+            return np.flatnonzero((tiles == color_num).any(axis=(1, 2))).tolist()
+        return self.redraw_blocks_using(pal_num, tiles_with_color)
+
+    def redraw_blocks_using_tileset(self, tileset_num):
+        def tiles_of_tileset(layer_num):
+            # Layer n uses tilesets n and n + 1
+            position = tileset_num - layer_num
+            if position not in (0, 1):
+                return ()
+            return range(position * Tileset.MAX_TILES, (position + 1) * Tileset.MAX_TILES)
+        return self.redraw_blocks_using(tile_nums_getter=tiles_of_tileset)
+
     def get_blocks_data(self, layer_num):
         return self.blocks[layer_num].to_bytes()
 
     def set_blocks_data(self, layer_num, raw_data):
-        self.blocks[layer_num].load_from_raw(raw_data)
+        self.blocks[layer_num].set_data(raw_data)
         self.redraw_blocks(layer_num)
 
     def get_blocks_behaviour_data(self, layer_num):
@@ -209,7 +262,7 @@ class Map:
         self.blocks[layer_num].set_behaviour_data(raw_data)
 
     def set_layer_data(self, layer_num, raw_data):
-        self.layers[layer_num].load_from_raw(raw_data)
+        self.layers[layer_num].set_data(raw_data)
 
     def get_layer_data(self, layer_num):
         return self.layers[layer_num].to_bytes()
\ No newline at end of file
@@ -3,6 +3,7 @@ from mapqeditorq.game import gba_image
 from mapqeditorq.game.structure_utils import StructureBase
 from . import common
 
+import numpy as np
 from PIL import Image
 
 
@@ -27,10 +28,13 @@ class Palettes:
     PALETTE_IMG.putdata(list(range(16)))
     PALETTE_IMG = PALETTE_IMG.resize((256, 64))
 
+    SHARED_PALETTES = ((0, 0), (1, 1), (15, 12))  # (palette number, palette table index)
+
     def __init__(self):
         self.header1 = None
 
-        self.palettes_list = [None] * 16
+        # rgb values of the 16 colors of the 16 palettes
+        self.colors = np.zeros((16, 16, 3), dtype=np.uint8)
         self.palettes_imgs = [None] * 16
         self.palettes_mod_count = [0] * 16
         self.modified = False
@@ -44,32 +48,41 @@ class Palettes:
         while True:
             header2_ptr = game.get_palette_header2_pointer(self.header1.get_palette_header2_index())
             header2 = game.read_struct_at(header2_ptr, PaletteHeader2)
-            for j in range(header2.amount_of_palettes):
-                palette_ptr = game.get_palette_pointer(header2.palette_table_index + j)
-                palette_data = game.read(palette_ptr, 32)
-                self.palettes_list[i] = common.palette_from_gba_to_rgb(palette_data)
-                i += 1
+            # The upper bit is the final flag
+            amount = header2.amount_of_palettes & 0x7f
+            # The palettes of a header are consecutive in the table, so they are read at once
+            palettes_data = game.read(game.get_palette_pointer(header2.palette_table_index), amount * 32)
+            self.colors[i:i + amount] = common.palette_from_gba_to_rgb(palettes_data).reshape(-1, 16, 3)
+            i += amount
             if header2.is_final():
                 break
 
     def load_shared_palettes(self, game):
         # Load palettes shared by all maps
-        for pal_index, table_index in ((0, 0), (1, 1), (15, 12)):
-            palette_ptr = game.get_palette_pointer(table_index)
-            palette_data = game.read(palette_ptr, 32)
-            self.palettes_list[pal_index] = common.palette_from_gba_to_rgb(palette_data)
+        last_table_index = max(table_index for _, table_index in self.SHARED_PALETTES)
+        table_data = game.read(game.get_palette_pointer(0), (last_table_index + 1) * 32)
+        table_colors = common.palette_from_gba_to_rgb(table_data).reshape(-1, 16, 3)
+        for pal_index, table_index in self.SHARED_PALETTES:
+            self.colors[pal_index] = table_colors[table_index]
 
     def set_palettes(self, palette_list):
         for i in range(13):
-            self.palettes_list[i + 2] = palette_list[i]
+            self.colors[i + 2] = gba_image.format_palette(palette_list[i])
 
     def get_palette(self, index):
-        return self.palettes_list[index]
+        return self.colors[index].ravel().tolist()
+
+    def get_palette_lut(self, index):
+        # Indexed with an array of color numbers, gives their rgb values
+        return self.colors[index]
+
+    def get_palettes_lut(self):
+        return self.colors
 
     def get_palette_img(self, index):
         if self.palettes_imgs[index] is None:
             self.palettes_imgs[index] = self.PALETTE_IMG.copy()
-            self.palettes_imgs[index].putpalette(self.palettes_list[index])
+            self.palettes_imgs[index].putpalette(self.get_palette(index))
         return self.palettes_imgs[index]
 
     def was_modified(self):
@@ -82,33 +95,22 @@ class Palettes:
         if not self.was_modified():
             self.modified = True
         self.palettes_mod_count[pal_num] += 1
-        self.palettes_imgs[pal_num].putpalette(self.palettes_list[pal_num])
+        if self.palettes_imgs[pal_num] is not None:
+            self.palettes_imgs[pal_num].putpalette(self.get_palette(pal_num))
 
     def set_palette(self, palette_num, palette):
-        self.palettes_list[palette_num] = palette
+        self.colors[palette_num] = gba_image.format_palette(palette)
         self.palettes_mod_count[palette_num] += 1
         self.set_palette_modified(palette_num)
 
     def set_color(self, pal_num, color_num, rgb):
-        r, g, b = rgb
-        self.palettes_list[pal_num][color_num * 3:(color_num + 1) * 3] = [r, g, b]
+        self.colors[pal_num, color_num] = rgb
         self.set_palette_modified(pal_num)
 
     def get_color(self, pal_num, color_num):
-        return self.palettes_list[pal_num][color_num * 3:(color_num + 1) * 3]
+        return self.colors[pal_num, color_num].tolist()
 
     def switch_color(self, pal_num, color1, color2):
         rgb1 = self.get_color(pal_num, color1)
         self.set_color(pal_num, color1, self.get_color(pal_num, color2))
         self.set_color(pal_num, color2, rgb1)
-
-
-
-
-
-
-
-
-
-
-
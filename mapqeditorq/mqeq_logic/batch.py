@@ -0,0 +1,153 @@
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import queue
+
+from ..maps.maps import InvalidMap
+from . import bulk_extraction
+from . import common
+from . import file_utils
+from .bulk_extraction import EXTRACTION_ERRORS
+from .bzproject import BzProj
+
+EXPORT = 'export'
+IMPORT = 'import'
+
+BATCH_ERRORS = EXTRACTION_ERRORS + (common.MqeqError, OSError)
+
+
+class MapBatchResult:
+    def __init__(self, group, subindex):
+        self.group = group
+        self.subindex = subindex
+        self.filenames = []
+        self.error = None
+        # Invalid maps are skipped, they are not an error of the batch
+        self.skipped = False
+
+    def failed(self):
+        return self.error is not None and not self.skipped
+
+
+def get_all_maps(game):
+    return [(group, subindex)
+            for group in range(game.get_map_groups_quanty())
+            for subindex in range(game.get_map_group_length(group))]
+
+
+def group_maps(maps):
+    groups = {}
+    for group, subindex in maps:
+        subindexes = groups.setdefault(group, [])
+        if subindex not in subindexes:
+            subindexes.append(subindex)
+    return groups
+
+
+def process_map(project, group, subindex, map_files, operation, directory, handled_filenames):
+    result = MapBatchResult(group, subindex)
+    try:
+        map_obj = project.load_map(group, subindex)
+        for number, filename in map_files.get_filenames(directory, map_obj):
+            # Blocks, tilesets and palettes are shared by several maps of the group
+            if filename in handled_filenames:
+                continue
+            if operation == EXPORT:
+                map_files.export_file(map_obj, number, filename)
+            elif os.path.exists(filename):
+                map_files.import_file(map_obj, number, filename)
+            else:
+                continue
+            handled_filenames.add(filename)
+            result.filenames.append(filename)
+        if operation == IMPORT and map_obj.was_modified():
+            project.save_changes()
+    except InvalidMap as e:
+        result.error = str(e)
+        result.skipped = True
+    except BATCH_ERRORS as e:
+        result.error = str(e)
+    return result
+
+
+def process_group(project, group, subindexes, map_files, operation, directory, finished):
+    """finished is called with the MapBatchResult of each map as soon as it is done."""
+    handled_filenames = set()
+    for subindex in subindexes:
+        finished(process_map(project, group, subindex, map_files, operation, directory, handled_filenames))
+
+
+# Project of each worker process of run_batch, loaded once for all the groups it processes,
+# and the queue the result of each map is sent through
+_worker_project = None
+_worker_results_queue = None
+
+
+def _set_worker_project(project_filename, results_queue):
+    global _worker_project, _worker_results_queue
+    _worker_project = BzProj()
+    # The decompression cache is locked by the process running the batch
+    _worker_project.load(project_filename, use_decompression_cache=False)
+    _worker_results_queue = results_queue
+
+
+def _process_group_in_worker(group, subindexes, map_files, operation, directory):
+    process_group(_worker_project, group, subindexes, map_files, operation, directory, _worker_results_queue.put)
+
+
+def run_batch(project, map_files, operation, directory, maps=None, max_workers=None, progress=None):
+    """
+    Exports or imports the files of map_files (a MapFiles) of every map in maps
+    (a list of (group, subindex), all the maps of the rom if None) from directory.
+    Only the files found in directory are imported.
+    Groups are processed in a pool of processes, each group by a single one,
+    as the files of a group are written by the maps of the group.
+    progress is called with (maps done, total of maps, MapBatchResult) as each map is finished.
+    Returns the list of MapBatchResult.
+    """
+    if maps is None:
+        maps = get_all_maps(project.game)
+    groups = group_maps(maps)
+    total = sum(len(subindexes) for subindexes in groups.values())
+    directory = os.path.abspath(directory)
+    if operation == EXPORT:
+        file_utils.mkdirs_p(directory)
+
+    results = []
+
+    def finished(result):
+        results.append(result)
+        if progress is not None:
+            progress(len(results), total, result)
+
+    if max_workers == 1 or len(groups) < 2:
+        for group, subindexes in groups.items():
+            process_group(project, group, subindexes, map_files, operation, directory, finished)
+    else:
+        # Opening a map for the first time writes it into the main tables, which would be
+        # written by several processes at once. They are written here once instead,
+        # for the groups that weren't extracted yet.
+        project.map_header_manager.load_main_table(project.game)
+        missing_groups = [
+            group for group in groups
+            if not bulk_extraction.is_group_extracted(project.map_header_manager.main_table, group)
+        ]
+        if missing_groups:
+            project.extract_all(max_workers, groups=missing_groups)
+        results_queue = multiprocessing.Queue()
+        initargs = (project.project_filename, results_queue)
+        with ProcessPoolExecutor(max_workers, initializer=_set_worker_project, initargs=initargs) as executor:
+            futures = [
+                executor.submit(_process_group_in_worker, group, subindexes, map_files, operation, directory)
+                for group, subindexes in groups.items()
+            ]
+            while len(results) < total:
+                try:
+                    finished(results_queue.get(timeout=0.1))
+                except queue.Empty:
+                    # A worker that crashed never sends the rest of its results
+                    for future in futures:
+                        if future.done():
+                            future.result()
+    return results
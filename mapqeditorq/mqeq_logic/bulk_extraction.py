@@ -0,0 +1,339 @@
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import struct
+
+from ..game.game import Game
+from ..game.lz77 import InvalidLz77Data
+from ..maps.blocks import Blocks
+from ..maps.map_layer import MapLayer
+from ..maps.maps import InvalidMap
+from ..maps.palettes import Palettes
+from ..maps.tilesets import Tileset
+from . import common
+from . import file_utils
+from .map_header_manager import MapHeaderManager, MapHeaderGroupTable
+from .map_layer_manager import MapLayerManager, MapLayersGroupTable, MapLayerHeadersTable
+from .map_blocks_manager import MapBlocksManager, GroupBlocksHeadersTable
+from .map_tileset_and_palettes_manager import MapTilesetAndPalettesManager, GroupTilesetTable, \
+    GroupTilesetsHeadersTable, TilesetIncBinManager, PalettesIncBinManager
+from .map_warps_manager import MapWarpsManager, SpecificMapWarpsTable, MapWarpsGroupTable
+
+# Errors of a map with garbage in its tables. The map is skipped, not the whole extraction.
+EXTRACTION_ERRORS = (InvalidMap, InvalidLz77Data, IndexError, ValueError, struct.error)
+
+
+class GroupExtraction:
+    """What was extracted from a group, sent back to the process writing the main tables."""
+    def __init__(self, group):
+        self.group = group
+        # Entry of the group in each main table, by the name of the manager
+        self.main_entries = {}
+        self.extracted_maps = []
+        self.skipped_maps = []
+        # Errors of the data shared by the maps of the group
+        self.errors = []
+        self.written_sources = 0
+
+
+class GroupExtractor:
+    """
+    Extracts the headers, layers, warps, blocks, tilesets and palettes of
+    every map of a group.
+    Every file of the group belongs to a single group, so they can be written
+    by the extractor of the group alone. The sources are kept in memory until
+    the whole group is extracted, so each one is written once.
+    """
+    def __init__(self, game, group):
+        self.game = game
+        self.group = group
+        self.editors = file_utils.CSourceEditors(common.MAP_FILES_INCLUDES)
+        self.extraction = GroupExtraction(group)
+
+        self.header_manager = MapHeaderManager()
+        self.layers_manager = MapLayerManager()
+        self.blocks_manager = MapBlocksManager()
+        self.tilesets_manager = MapTilesetAndPalettesManager()
+        self.warps_manager = MapWarpsManager()
+
+    def load_table(self, table):
+        table.load_from_editor(self.game, self.editors.get(table.filename))
+        return table
+
+    def save_table(self, table):
+        table.save_to_editor(self.editors.get(table.filename))
+
+    def save_incbin(self, incbin):
+        incbin.save_to_editor(self.editors.get(incbin.definition_filename))
+
+    def extract(self):
+        group = self.group
+        headers_table = self.load_table(MapHeaderGroupTable(
+            group,
+            self.header_manager.get_group_filename(group),
+            self.header_manager.get_group_table_definition(group)
+        ))
+        self.extraction.main_entries['headers'] = headers_table.definition.as_extern()
+
+        layers_table = self.load_table(MapLayersGroupTable(
+            group,
+            self.layers_manager.get_group_table_filename(group),
+            self.layers_manager.get_group_table_definition(group)
+        ))
+        warps_table = self.load_table(MapWarpsGroupTable(
+            group,
+            self.warps_manager.get_group_table_filename(group),
+            self.warps_manager.get_group_table_definition(group)
+        ))
+        tilesets_table = self.load_table(GroupTilesetTable(
+            group,
+            self.tilesets_manager.get_group_filename(group),
+            self.tilesets_manager.get_group_tileset_table_definition(group)
+        ))
+
+        tilesets_indexes = set()
+        for subindex in range(len(headers_table)):
+            header = headers_table[subindex]
+            try:
+                if header.tiles_wide <= 0 or header.tiles_high <= 0:
+                    raise InvalidMap('Wrong map size. tiles wide: {0}, tiles high: {1}'.format(
+                        header.tiles_wide, header.tiles_high
+                    ))
+                if header.tileset_subindex >= len(tilesets_table):
+                    raise InvalidMap('Invalid tilesets index: {0}'.format(header.tileset_subindex))
+                self.extract_layers(layers_table, subindex)
+                self.extract_warps(warps_table, subindex)
+            except EXTRACTION_ERRORS as e:
+                self.extraction.skipped_maps.append((subindex, str(e)))
+                continue
+            tilesets_indexes.add(header.tileset_subindex)
+            self.extraction.extracted_maps.append(subindex)
+
+        if self.extraction.extracted_maps:
+            try:
+                self.extract_blocks()
+            except EXTRACTION_ERRORS as e:
+                self.extraction.errors.append('blocks: {0}'.format(e))
+            for tilesets_index in sorted(tilesets_indexes):
+                try:
+                    self.extract_tilesets(tilesets_table, tilesets_index)
+                except EXTRACTION_ERRORS as e:
+                    self.extraction.errors.append('tilesets {0}: {1}'.format(tilesets_index, e))
+
+            self.save_table(layers_table)
+            self.save_table(warps_table)
+            self.save_table(tilesets_table)
+            self.extraction.main_entries['layers'] = layers_table.definition.as_extern()
+            self.extraction.main_entries['warps'] = warps_table.definition.as_extern()
+            self.extraction.main_entries['tilesets'] = tilesets_table.definition.as_extern()
+        self.save_table(headers_table)
+
+        self.extraction.written_sources = self.editors.save()
+        return self.extraction
+
+    def extract_layers(self, layers_table, subindex):
+        manager = self.layers_manager
+        headers_table = self.load_table(MapLayerHeadersTable(
+            self.group,
+            subindex,
+            manager.get_headers_filename(self.group, subindex),
+            manager.get_headers_definition(self.group, subindex)
+        ))
+        layers_table[subindex] = headers_table.definition.as_extern()
+
+        for header in headers_table:
+            layer_num = manager.get_layer_num(header)
+            if layer_num is not None:
+                layer = MapLayer()
+                layer.set_header(header)
+                incbin = common.MapDataBinaryFile(
+                    manager.get_layer_filename(self.group, subindex, layer_num),
+                    manager.get_headers_filename(self.group, subindex),
+                    manager.get_map_layer_incbin_definition(layer_num),
+                    layer
+                )
+                incbin.load_data(self.game)
+                self.save_incbin(incbin)
+        self.save_table(headers_table)
+
+    def extract_warps(self, warps_table, subindex):
+        manager = self.warps_manager
+        map_warps_table = self.load_table(SpecificMapWarpsTable(
+            self.group,
+            subindex,
+            manager.get_specific_map_filename(self.group, subindex),
+            manager.get_map_warps_definition(self.group, subindex)
+        ))
+        warps_table[subindex] = map_warps_table.definition.as_extern()
+
+    def extract_blocks(self):
+        manager = self.blocks_manager
+        headers_table = self.load_table(GroupBlocksHeadersTable(
+            self.group,
+            manager.get_headers_filename(self.group),
+            manager.get_group_table_definition(self.group)
+        ))
+        self.extraction.main_entries['blocks'] = headers_table.definition.as_extern()
+
+        blocks = [Blocks(), Blocks()]
+        # In the same order as the manager saves them
+        incbins = [[None, None], [None, None]]
+        for header in headers_table:
+            is_img_data, blocks_index = manager.identify_blocks_data_type(header)
+            if blocks_index is not None:
+                if is_img_data:
+                    obj = blocks[blocks_index]
+                else:
+                    obj = blocks[blocks_index].get_behaviours_object()
+                obj.set_header(header)
+                incbins[blocks_index][is_img_data] = common.MapDataBinaryFile(
+                    manager.get_incbin_filename(self.group, blocks_index, is_img_data),
+                    manager.get_headers_filename(self.group),
+                    manager.get_incbin_definition(blocks_index, is_img_data),
+                    obj
+                )
+                incbins[blocks_index][is_img_data].load_data(self.game)
+
+        for blocks_incbins in incbins:
+            for incbin in blocks_incbins:
+                if incbin is not None:
+                    self.save_incbin(incbin)
+        self.save_table(headers_table)
+
+    def extract_tilesets(self, tilesets_table, tilesets_index):
+        manager = self.tilesets_manager
+        headers_table = self.load_table(GroupTilesetsHeadersTable(
+            tilesets_index,
+            self.group,
+            manager.get_group_filename(self.group),
+            manager.get_group_header_table_definition(tilesets_index)
+        ))
+        tilesets_table[tilesets_index] = headers_table.definition.copy()
+
+        palettes = Palettes()
+        # In the same order as the manager saves them
+        incbins = [None, None, None, None]
+        for header in headers_table:
+            if header.is_palette_header():
+                palettes.set_header(header)
+                incbins[3] = PalettesIncBinManager(
+                    manager.get_palette_incbin_base_filename(self.group, tilesets_index),
+                    manager.get_group_filename(self.group),
+                    manager.get_palette_incbin_definition(tilesets_index),
+                    palettes
+                )
+                incbins[3].load(self.game)
+            else:
+                tileset_num = manager.get_tileset_num(header)
+                if tileset_num is None:
+                    continue
+                tileset = Tileset()
+                tileset.set_header(header)
+                tileset.set_palettes(palettes)
+                incbins[tileset_num] = TilesetIncBinManager(
+                    manager.get_tileset_incbin_filename(self.group, tilesets_index, tileset_num),
+                    manager.get_group_filename(self.group),
+                    manager.get_tileset_incbin_definition(tileset_num, tilesets_index),
+                    tileset
+                )
+
+        for incbin in incbins[:3]:
+            if incbin is not None:
+                incbin.load(self.game)
+        for incbin in incbins:
+            if incbin is not None:
+                self.save_incbin(incbin)
+        self.save_table(headers_table)
+
+
+# Game of each worker process of extract_all. Every process maps the same rom file.
+_worker_game = None
+
+
+def _set_worker_game(rom_filename, map_group_lengths, project_dir):
+    global _worker_game
+    os.chdir(project_dir)
+    _worker_game = Game()
+    _worker_game.load(rom_filename)
+    _worker_game.set_map_group_lengths(map_group_lengths)
+
+
+def _extract_group_in_worker(group):
+    return GroupExtractor(_worker_game, group).extract()
+
+
+def get_main_tables_managers(project):
+    return {
+        'headers': project.map_header_manager,
+        'layers': project.map_layers_manager,
+        'blocks': project.map_blocks_manager,
+        'tilesets': project.map_tilesets_and_palettes_manager,
+        'warps': project.map_warps_manager,
+    }
+
+
+def is_group_extracted(headers_main_table, group):
+    # Entries of groups already extracted point to their tables in the project, not to the rom
+    return not isinstance(headers_main_table[group], int)
+
+
+def get_valid_groups(game, headers_main_table):
+    groups = []
+    for group in range(len(headers_main_table)):
+        ptr = headers_main_table[group]
+        if isinstance(ptr, int) and (ptr == 0 or game.pointer_unmask(ptr) <= 0):
+            continue
+        groups.append(group)
+    return groups
+
+
+def extract_all(project, max_workers=None, progress=None, groups=None):
+    """
+    Extracts every valid map of the project's rom (or of the given groups) into the project.
+    Groups are extracted in a pool of processes, each one writing the files
+    of its groups. The main tables are written at the end by this process
+    only, once.
+    progress is called with (groups done, total of groups, GroupExtraction)
+    as each group is finished.
+    Returns the list of GroupExtraction, sorted by group.
+    """
+    game = project.game
+    managers = get_main_tables_managers(project)
+    editors = file_utils.CSourceEditors(common.MAP_FILES_INCLUDES)
+    for manager in managers.values():
+        manager.main_table.load_from_editor(game, editors.get(manager.main_table.filename))
+        manager.write_repoints(game)
+    valid_groups = get_valid_groups(game, managers['headers'].main_table)
+    if groups is None:
+        groups = valid_groups
+    else:
+        groups = [group for group in valid_groups if group in groups]
+
+    extractions = []
+
+    def finished(extraction):
+        extractions.append(extraction)
+        if progress is not None:
+            progress(len(extractions), len(groups), extraction)
+
+    if max_workers == 1 or len(groups) < 2:
+        for group in groups:
+            if max_workers != 1 and not is_group_extracted(managers['headers'].main_table, group):
+                # A single group: its compressed data is decompressed in parallel instead
+                game.prefetch_compressed(game.get_group_compressed_addresses(group), max_workers)
+            finished(GroupExtractor(game, group).extract())
+    else:
+        initargs = (game.rom_filename, game.map_group_lengths, os.getcwd())
+        with ProcessPoolExecutor(max_workers, initializer=_set_worker_game, initargs=initargs) as executor:
+            futures = [executor.submit(_extract_group_in_worker, group) for group in groups]
+            for future in as_completed(futures):
+                finished(future.result())
+
+    extractions.sort(key=lambda extraction: extraction.group)
+    for extraction in extractions:
+        for name, definition in extraction.main_entries.items():
+            managers[name].main_table[extraction.group] = definition
+    for manager in managers.values():
+        manager.main_table.save_to_editor(editors.get(manager.main_table.filename))
+    editors.save()
+    return extractions
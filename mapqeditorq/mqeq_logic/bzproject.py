@@ -1,7 +1,9 @@
 
 from ..game.game import Game
+from ..game.decompression_cache import DecompressionCache, CacheInUseError
 from ..maps.maps import Map
 from . import common
+from . import bulk_extraction
 from .map_header_manager import MapHeaderManager
 from .map_layer_manager import MapLayerManager
 from .map_blocks_manager import MapBlocksManager
@@ -52,16 +54,50 @@ class BzProj:
         }
         self.save_config()
         os.chdir(project_dir)
-        self.game.load(self.BASEROM_NAME)
+        self.load_game(self.BASEROM_NAME)
 
-    def load(self, proj_filename):
+    def load(self, proj_filename, use_decompression_cache=True):
         self.project_filename = os.path.abspath(proj_filename)
         self.config.read(self.project_filename)
         os.chdir(os.path.dirname(self.project_filename))
-        self.game.load(self.config['PROJECT']['Rom'])
+        self.load_game(self.config['PROJECT']['Rom'], use_decompression_cache)
+
+    def load_game(self, rom_filename, use_decompression_cache=True):
+        self.game.load(rom_filename)
+        self.close_decompression_cache()
+        if use_decompression_cache:
+            try:
+                self.game.set_decompression_cache(DecompressionCache(common.get_cache_dir()))
+            except CacheInUseError:
+                # Another editor has the cache, this one works without it
+                pass
+        self.load_map_group_lengths()
+
+    def close_decompression_cache(self):
+        if self.game.decompression_cache is not None:
+            self.game.decompression_cache.close()
+            self.game.set_decompression_cache(None)
+
+    def load_map_group_lengths(self):
+        # The bounds of the map header table are kept in the project along with the
+        # hash of the rom they were found in, and found again if the rom changes
+        if 'MQEQ' not in self.config:
+            self.config['MQEQ'] = {}
+        mqeq_config = self.config['MQEQ']
+        rom_hash = self.game.rom_hash.hex()
+        if 'MapGroupLengths' in mqeq_config and mqeq_config.get('MapGroupLengthsRomHash') == rom_hash:
+            lengths = [int(length, base=16) for length in mqeq_config['MapGroupLengths'].split(',') if length]
+        else:
+            lengths = self.game.find_map_group_lengths()
+            mqeq_config['MapGroupLengths'] = ','.join(hex(length) for length in lengths)
+            mqeq_config['MapGroupLengthsRomHash'] = rom_hash
+            self.save_config()
+        self.game.set_map_group_lengths(lengths)
 
     def close(self):
         self.save_config()
+        self.close_decompression_cache()
+        self.game.close()
 
     def save_config(self):
         with open(self.project_filename, 'w') as f:
@@ -72,6 +108,10 @@ class BzProj:
         map_obj.load(index, subindex, self)
         return map_obj
 
+    def extract_all(self, max_workers=None, progress=None, groups=None):
+        """Extracts every map of the rom at once. See bulk_extraction.extract_all."""
+        return bulk_extraction.extract_all(self, max_workers, progress, groups)
+
     def get_map_header(self, map_index, map_subindex):
         return self.map_header_manager.get_map_header(self.game, map_index, map_subindex)
 
@@ -0,0 +1,139 @@
+
+import argparse
+import os
+import sys
+
+from . import batch
+from .bzproject import BzProj
+from .map_files import MAP_FILES, TilesetFiles
+
+
+def print_extraction_progress(done, total, extraction, out=sys.stdout):
+    out.write('[{0}/{1}] group {2}: {3} maps extracted, {4} skipped, {5} sources written\n'.format(
+        done, total, hex(extraction.group), len(extraction.extracted_maps),
+        len(extraction.skipped_maps), extraction.written_sources
+    ))
+    for subindex, reason in extraction.skipped_maps:
+        out.write('    map {0}, {1} skipped: {2}\n'.format(hex(extraction.group), hex(subindex), reason))
+    for error in extraction.errors:
+        out.write('    group {0} error: {1}\n'.format(hex(extraction.group), error))
+    out.flush()
+
+
+def print_batch_progress(done, total, result, out=sys.stdout):
+    if result.skipped:
+        status = 'skipped: ' + result.error
+    elif result.error is not None:
+        status = 'error: ' + result.error
+    else:
+        status = '{0} files'.format(len(result.filenames))
+    out.write('[{0}/{1}] map {2}, {3} {4}\n'.format(done, total, hex(result.group), hex(result.subindex), status))
+    for filename in result.filenames:
+        out.write('    {0}\n'.format(filename))
+    out.flush()
+
+
+def parse_maps(project, maps_args):
+    """Each argument is either GROUP:SUBINDEX or GROUP, for every map of the group."""
+    if not maps_args:
+        return None
+    maps = []
+    for arg in maps_args:
+        group, _, subindex = arg.partition(':')
+        try:
+            group = int(group, 0)
+            if subindex:
+                maps.append((group, int(subindex, 0)))
+            else:
+                maps.extend((group, i) for i in range(project.game.get_map_group_length(group)))
+        except (ValueError, IndexError):
+            raise argparse.ArgumentTypeError('Invalid map "{0}"'.format(arg))
+    return maps
+
+
+def extract_all(project, args):
+    project.extract_all(args.jobs, print_extraction_progress)
+    return 0
+
+
+def find_pointers(project, args, out=sys.stdout):
+    game = project.game
+    for name, address, known_pointers in game.REPOINTED_TABLES:
+        unknown_pointers = game.find_unknown_pointers_to(address, known_pointers)
+        out.write('{0} table {1}: {2} pointers repointed, {3} not repointed\n'.format(
+            name, hex(game.pointer_mask(address)), len(known_pointers), len(unknown_pointers)
+        ))
+        for pointer in unknown_pointers:
+            out.write('    {0}\n'.format(hex(pointer)))
+    return 0
+
+
+def run_batch(project, args):
+    if args.kind == 'tilesets':
+        map_files = TilesetFiles(args.palette)
+    else:
+        map_files = MAP_FILES[args.kind]()
+    results = batch.run_batch(
+        project, map_files, args.command, args.directory,
+        parse_maps(project, args.maps), args.jobs, print_batch_progress
+    )
+    failed = sum(result.failed() for result in results)
+    if failed:
+        sys.stderr.write('{0} maps failed\n'.format(failed))
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='mqeq', description='MQEQ without the GUI.')
+    parser.add_argument('project', help='.bzproj file of the project')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    jobs_parser = argparse.ArgumentParser(add_help=False)
+    jobs_parser.add_argument('--jobs', '-j', type=int, default=None, help='amount of worker processes')
+
+    extract_all_parser = subparsers.add_parser(
+        'extract-all', parents=[jobs_parser], help='extract every map of the rom into the project'
+    )
+    extract_all_parser.set_defaults(function=extract_all)
+
+    find_pointers_parser = subparsers.add_parser(
+        'find-pointers',
+        help='list the words of the rom with the address of a repointed table, which are not repointed'
+    )
+    find_pointers_parser.set_defaults(function=find_pointers)
+
+    for operation, help_txt in ((batch.EXPORT, 'export map data to a directory'),
+                                (batch.IMPORT, 'import the map data found in a directory')):
+        batch_parser = subparsers.add_parser(operation, parents=[jobs_parser], help=help_txt)
+        batch_parser.add_argument('kind', choices=sorted(MAP_FILES), help='data to {0}'.format(operation))
+        # Resolved before loading the project, which changes the working directory
+        batch_parser.add_argument('directory', type=os.path.abspath, help='directory of the files')
+        batch_parser.add_argument(
+            '--maps', '-m', nargs='+', metavar='MAP',
+            help='GROUP:SUBINDEX of the maps, or GROUP for every map of the group (all maps by default)'
+        )
+        if operation == batch.EXPORT:
+            batch_parser.add_argument(
+                '--palette', '-p', type=int, default=2, help='palette of the exported tilesets images'
+            )
+        else:
+            batch_parser.set_defaults(palette=2)
+        batch_parser.set_defaults(function=run_batch)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    project = BzProj()
+    try:
+        project.load(args.project)
+        try:
+            return args.function(project, args)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    finally:
+        project.close()
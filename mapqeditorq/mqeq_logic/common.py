@@ -9,6 +9,7 @@ MAPS_DIR = 'data/maps'
 ASM_PATCHES_DIR = 'asm/mqeq/patches'
 EDITOR_DIRECTORY = os.path.abspath(os.path.dirname(os.path.realpath(sys.argv[0])))
 TMP_DIR = os.path.join(EDITOR_DIRECTORY, 'tmp')
+CACHE_DIR = os.path.join(EDITOR_DIRECTORY, 'cache')
 SETTINGS_FILENAME = os.path.join(EDITOR_DIRECTORY, 'settings.dat')
 
 TILESET_MAX_SIZE = 512
@@ -24,6 +25,12 @@ def get_temp_dir():
     return TMP_DIR
 
 
+def get_cache_dir():
+    if not os.path.exists(CACHE_DIR):
+        file_utils.mkdirs_p(CACHE_DIR)
+    return CACHE_DIR
+
+
 MAP_FILES_INCLUDES = '\n#include <global.h>\n#include <map.h>\n\n'
 
 
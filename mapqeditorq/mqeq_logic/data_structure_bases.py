@@ -4,7 +4,8 @@ import os
 
 from . import common
 from . import file_utils
-from .parsers import CParser, DefinitionNotFoundError, CDefinition
+from .parsers import CParser, CSourceIndex, DefinitionNotFoundError, CDefinition
+from .table_cache import TableCache
 
 
 class BaseTable(abc.ABC):
@@ -22,33 +23,72 @@ class BaseTable(abc.ABC):
         raise NotImplementedError('You must override this')
 
     @abc.abstractmethod
-    def parse_array(self, txt):
+    def parse_array(self, source):
         raise NotImplementedError('You must override this')
 
+    @abc.abstractmethod
+    def table_to_rows(self):
+        raise NotImplementedError('You must override this')
+
+    @abc.abstractmethod
+    def table_from_rows(self, rows):
+        raise NotImplementedError('You must override this')
+
+    @staticmethod
+    def get_table_cache():
+        return TableCache(os.path.join(common.get_cache_dir(), 'tables'))
+
     def load(self, game):
+        # Tables parsed before from the same source are read from the cache
+        table_cache = self.get_table_cache()
+        rows = table_cache.load(self.filename, self.get_label())
+        if rows is not None:
+            self.table = self.table_from_rows(rows)
+            return
+
         with file_utils.EasyOpen(self.filename, file_header=common.MAP_FILES_INCLUDES) as f:
             contents = f.read()
             try:
-                self.table = self.parse_array(contents)
+                self.table = self.parse_array(CSourceIndex(contents))
             except DefinitionNotFoundError:
                 self.table = self.extract_array(game)
                 self.save()
-
-    def add_dependencies_prototypes(self, original_txt, new_txt):
+                return
+        table_cache.save(self.filename, self.get_label(), self.table_to_rows())
+
+    def load_from_editor(self, game, editor):
+        """Like load, but the source is read and edited through editor, which the caller saves."""
+        try:
+            self.table = self.parse_array(editor.get_source())
+        except DefinitionNotFoundError:
+            self.table = self.extract_array(game)
+            self.save_to_editor(editor)
+
+    @staticmethod
+    def add_missing_prototype(source, definition, prototypes):
+        prototype = definition.as_prototype()
+        if prototype not in prototypes and not CParser.is_prototype_declared(definition, source):
+            prototypes.append(prototype)
+
+    def get_missing_prototypes(self, source):
+        prototypes = []
         for extern in self.extern_entries:
-            if not CParser.is_prototype_declared(extern, original_txt):
-                new_txt = '{0}\n\n{1}'.format(extern.as_prototype(), new_txt)
-        return new_txt
+            self.add_missing_prototype(source, extern, prototypes)
+        return prototypes
 
     def save(self):
-        with file_utils.TextFileEditor(self.filename, file_header=common.MAP_FILES_INCLUDES) as f:
-            txt = f.read_contents()
-            new_txt = self.get_initialization_text()
-            new_txt = self.add_dependencies_prototypes(txt, new_txt)
-            txt = CParser.change_initialization(
-                txt, self.definition, new_txt
-            )
-            f.write(txt)
+        # Only the initializer of the table (and missing prototypes) are replaced in the file,
+        # which is not written at all if nothing changed
+        editor = file_utils.CSourceEditor(self.filename, file_header=common.MAP_FILES_INCLUDES)
+        self.save_to_editor(editor)
+        editor.save()
+
+    def save_to_editor(self, editor):
+        editor.set_initializer(
+            self.definition,
+            self.get_initializer_text(),
+            self.get_missing_prototypes(editor.get_source())
+        )
         self.modified = False
 
     def loaded(self):
@@ -80,12 +120,8 @@ class BaseTable(abc.ABC):
     def get_label(self):
         return self.definition.get_label()
 
-    def get_initialization_text(self):
-        ret = CParser.format_initialization(
-            self.definition,
-            CParser.format_array_contents(self.table)
-        )
-        return ret
+    def get_initializer_text(self):
+        return CParser.format_initializer(CParser.format_array_contents(self.table))
 
     def get_array(self):
         return self.table
@@ -94,8 +130,8 @@ class BaseTable(abc.ABC):
 class StructTableBase(BaseTable):
     StructClass = None
 
-    def parse_array(self, txt):
-        struct_strings = CParser.parse_struct_array(txt, self.definition)
+    def parse_array(self, source):
+        struct_strings = CParser.parse_struct_array(source, self.definition)
         struct_count = len(struct_strings)
         array = [None] * struct_count
         for i in range(struct_count):
@@ -104,13 +140,23 @@ class StructTableBase(BaseTable):
             array[i] = header
         return array
 
-    def add_dependencies_prototypes(self, original_txt, new_txt):
-        new_txt = super().add_dependencies_prototypes(original_txt, new_txt)
+    def table_to_rows(self):
+        field_names = self.StructClass.FIELD_NAMES
+        return [tuple(getattr(s, attribute) for attribute in field_names) for s in self.table]
+
+    def table_from_rows(self, rows):
+        array = [None] * len(rows)
+        for i, row in enumerate(rows):
+            array[i] = self.StructClass()
+            array[i].set_values(row)
+        return array
+
+    def get_missing_prototypes(self, source):
+        prototypes = super().get_missing_prototypes(source)
         for s in self.table:
             for dependency in s.dependencies:
-                if not CParser.is_prototype_declared(dependency, original_txt):
-                    new_txt = '{0}\n\n{1}'.format(dependency.as_prototype(), new_txt)
-        return new_txt
+                self.add_missing_prototype(source, dependency, prototypes)
+        return prototypes
 
     def was_modified(self):
         if super().was_modified():
@@ -123,8 +169,14 @@ class StructTableBase(BaseTable):
 
 
 class NumberTableBase(BaseTable):
-    def parse_array(self, txt):
-        return CParser.parse_number_array(txt, self.definition)
+    def parse_array(self, source):
+        return CParser.parse_number_array(source, self.definition)
+
+    def table_to_rows(self):
+        return [(value,) for value in self.table]
+
+    def table_from_rows(self, rows):
+        return [row[0] for row in rows]
 
 
 class IncludedBinaryFileBase(abc.ABC):
@@ -164,23 +216,17 @@ class IncludedBinaryFileBase(abc.ABC):
         self.set_data_to_object(data)
 
     def save(self):
+        editor = file_utils.CSourceEditor(self.definition_filename, file_header=common.MAP_FILES_INCLUDES)
+        self.save_to_editor(editor)
+        editor.save()
+
+    def save_to_editor(self, editor):
+        """Writes the data file, and declares it through editor, which the caller saves."""
         data = self.get_data_from_object()
-        with file_utils.EasyOpen(self.data_filename, 'wb') as f:
-            f.write(data)
-
-        with file_utils.TextFileEditor(
-                self.definition_filename,
-                file_header=common.MAP_FILES_INCLUDES) as f:
-            txt = f.read_contents()
-            new_txt = self.get_initialization_text()
-
-            if not CParser.is_definition_in_text(self.definition, txt):
-                txt = CParser.change_initialization(
-                    txt, self.definition, new_txt
-                )
-                f.write(txt)
-            else:
-                f.cancel()
+        file_utils.write_file_if_changed(self.data_filename, data, 'wb')
+
+        if not editor.is_declared(self.definition):
+            editor.append(self.get_initialization_text())
 
         self.after_saving_object_update()
 
@@ -1,7 +1,7 @@
 
 import os
 
-from . import common
+from .parsers import CParser, CSourceIndex
 
 
 def mkdirs_p(*dirnames):
@@ -37,51 +37,110 @@ class EasyOpen:
         self.file_obj.close()
 
 
-class TextFileEditor:
+def write_file_if_changed(filename, contents, mode='w', **kwargs):
+    """
+    Writes contents to a temporary file next to filename and then replaces it,
+    so the file is never left half written. If the file already has those
+    contents nothing is written, keeping its modification time.
+    Returns whether the file was written.
+    """
+    read_mode = 'rb' if 'b' in mode else 'r'
+    # Line endings are translated when reading, so they are compared as written
+    read_kwargs = {key: value for key, value in kwargs.items() if key != 'newline'}
+    if os.path.exists(filename):
+        with open(filename, read_mode, **read_kwargs) as f:
+            if f.read() == contents:
+                return False
+    else:
+        create_containing_dir_if_necessary(filename)
+
+    # Named after the process, as other processes may be writing the same file
+    tmp_filename = '{0}.{1}.tmp'.format(filename, os.getpid())
+    with open(tmp_filename, mode, **kwargs) as f:
+        f.write(contents)
+    os.replace(tmp_filename, filename)
+    return True
+
+
+class CSourceEditor:
+    """
+    Edits the definitions of a C source file using the spans of its CSourceIndex.
+    The changes are spliced into the original text, so the rest of the file is
+    kept as it was, and the file is only written if it ends up different.
+    Pending changes are applied to the index before it is used again, so the
+    same editor can be used for several definitions.
+    """
     def __init__(self, filename, file_header=None):
-        self.original_filename = os.path.abspath(filename)
-        self.backup_name = None
-        if os.path.exists(self.original_filename):
-            self.backup_name = os.path.join(
-                common.get_temp_dir(),
-                os.path.basename(filename) + '.bak'
-            )
-            os.rename(self.original_filename, self.backup_name)
-
-        self.file_obj = open(self.original_filename, 'w')
-        self.file_header = file_header
-        self.canceled = False
-
-    def read_contents(self):
-        if self.backup_name is not None:
-            with open(self.backup_name) as f:
-                ret = f.read()
-            return ret
+        self.filename = filename
+        if os.path.exists(filename):
+            with open(filename) as f:
+                txt = f.read()
         else:
-            return self.file_header
-
-    def write(self, contents):
-        self.file_obj.write(contents)
-
-    def close(self):
-        self.file_obj.close()
-        if self.backup_name is not None and os.path.exists(self.backup_name):
-            os.remove(self.backup_name)
-
-    def cancel(self):
-        self.file_obj.close()
-        os.remove(self.original_filename)
-        if self.backup_name is not None and os.path.exists(self.backup_name):
-            os.rename(self.backup_name, self.original_filename)
-        self.canceled = True
-
-    def __enter__(self):
-        return self
+            txt = file_header if file_header is not None else ''
+        self.source = CSourceIndex(txt)
+        self.edits = []
+        self.appended = ''
+
+    def get_source(self):
+        if self.edits or self.appended:
+            self.source = CSourceIndex(self.get_contents())
+            self.edits = []
+            self.appended = ''
+        return self.source
+
+    def is_declared(self, definition):
+        return self.get_source().is_declared(definition)
+
+    def append(self, txt):
+        self.appended += '\n\n' + txt
+
+    def set_initializer(self, definition, initializer, prototypes=()):
+        """
+        Replaces the initializer of the definition, which is added at the end
+        of the file if it is not defined. prototypes are added before it.
+        """
+        prototypes_txt = ''.join(prototype + '\n\n' for prototype in prototypes)
+        source = self.get_source()
+        statement = source.get_definition(definition)
+        if statement is None:
+            self.append(prototypes_txt + CParser.format_initialization_with_initializer(definition, initializer))
+            return
+
+        if prototypes_txt:
+            self.edits.append((statement.start, statement.start, prototypes_txt))
+        # The initializer span starts right after the '='
+        initializer = ' ' + initializer
+        if source.txt[statement.initializer_start:statement.initializer_end] != initializer:
+            self.edits.append((statement.initializer_start, statement.initializer_end, initializer))
+
+    def get_contents(self):
+        txt = self.source.txt
+        contents = ''
+        position = 0
+        for start, end, new_txt in sorted(self.edits, key=lambda edit: edit[:2]):
+            contents += txt[position:start] + new_txt
+            position = end
+        return contents + txt[position:] + self.appended
+
+    def save(self):
+        """Returns whether the file was written."""
+        return write_file_if_changed(self.filename, self.get_contents())
+
+
+class CSourceEditors:
+    """
+    Editors of several C sources, kept in memory until all of them are saved,
+    so a file edited many times is written only once.
+    """
+    def __init__(self, file_header=None):
+        self.file_header = file_header
+        self.editors = {}
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        if not self.canceled:
-            if exc_type is None:
-                self.close()
-            else:
-                self.cancel()
+    def get(self, filename):
+        if filename not in self.editors:
+            self.editors[filename] = CSourceEditor(filename, file_header=self.file_header)
+        return self.editors[filename]
 
+    def save(self):
+        """Returns the amount of files written."""
+        return sum(editor.save() for editor in self.editors.values())
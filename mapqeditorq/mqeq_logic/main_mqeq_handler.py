@@ -2,13 +2,12 @@
 import os.path
 
 from ..gui.console_dialog import ConsoleDialog
-from ..game import gba_image
 from .bzproject import BzProj
 from . import settings
 from . import common
+from . import map_files
 from .subprocess_reader import SubprocessReader
 
-from PIL import Image
 import subprocess
 
 
@@ -122,8 +121,8 @@ class MainMqeqHandler:
     def paint_map_tile(self, tile_num):
         self.loaded_map.set_map_tile(self.selected_layer, tile_num, self.selected_block)
 
-    def get_map_image(self):
-        return self.loaded_map.draw_layer(self.selected_layer)
+    def get_map_tilemap(self):
+        return self.loaded_map.get_layer_tilemap(self.selected_layer)
 
     def get_blocks_image(self):
         return self.loaded_map.get_blocks_full_img(self.selected_layer)
@@ -141,8 +140,10 @@ class MainMqeqHandler:
         if self.loaded_map.get_block_data(self.selected_block, self.selected_layer)[block_part] != data:
             self.loaded_map.set_block_data(self.selected_block, block_part, data, self.selected_layer)
 
-    def get_block_image(self):
-        return self.loaded_map.get_block_img(self.selected_block, self.selected_layer)
+    def get_block_image(self, block_num=None):
+        if block_num is None:
+            block_num = self.selected_block
+        return self.loaded_map.get_block_img(block_num, self.selected_layer)
 
     def set_selected_palette(self, pal_num):
         self.selected_palette = pal_num & 0xf
@@ -158,24 +159,15 @@ class MainMqeqHandler:
 
     @staticmethod
     def open_image(filename):
-        try:
-            img = Image.open(filename)
-        except FileNotFoundError:
-            raise common.MqeqError('The file "{0}" does not exist'.format(filename))
-        except OSError:
-            raise common.MqeqError('Unknown image format'.format(filename))
-        try:
-            gba_image.validate_gbaimage(img)
-        except gba_image.ImageFormatError as e:
-            raise common.MqeqError(str(e))
-        return img
+        return map_files.open_image(filename)
 
     def load_palette_from_image(self, filename):
         if not self.is_palette_modification_allowed():
             raise common.MqeqError('This palette does not belong to the map')
         img = self.open_image(filename)
 
-        self.loaded_map.set_palette(self.selected_palette, img.getpalette())
+        # Numbers of the redrawn blocks of the selected layer
+        return self.loaded_map.set_palette(self.selected_palette, img.getpalette())[self.selected_layer]
 
     def select_color(self, color_num):
         if color_num < 0 or color_num > 15:
@@ -189,7 +181,7 @@ class MainMqeqHandler:
         return self.loaded_map.get_color_rgb_values(self.selected_palette, self.selected_color)
 
     def modify_selected_color(self, rgb):
-        self.loaded_map.modify_color(self.selected_palette, self.selected_color, rgb)
+        return self.loaded_map.modify_color(self.selected_palette, self.selected_color, rgb)[self.selected_layer]
 
     def get_selected_tileset_image(self):
         return self.loaded_map.get_tileset_image(self.selected_palette, self.selected_tileset)
@@ -200,17 +192,10 @@ class MainMqeqHandler:
         self.selected_tileset = tileset_num
 
     def export_selected_tileset(self, filename):
-        img = self.get_selected_tileset_image()
-        w, h = img.size
-        img = img.resize((w // 2, h // 2))
-        img.save(filename, 'PNG')
+        map_files.export_tileset(self.loaded_map, self.selected_tileset, self.selected_palette, filename)
 
     def replace_selected_tileset(self, filename):
-        img = self.open_image(filename)
-        w, h = img.size
-        if w != 128 or h != 256:
-            raise common.MqeqError('The tileset image size has to be 128x256 px')
-        self.loaded_map.change_tileset_image(self.selected_tileset, img)
+        return map_files.import_tileset(self.loaded_map, self.selected_tileset, filename)[self.selected_layer]
 
     def select_tile_at_block_part(self, block_part):
         self.selected_tile, flip_x, flip_y, self.selected_palette = self.loaded_map.get_block_data(
@@ -222,29 +207,20 @@ class MainMqeqHandler:
         return self.selected_palette
 
     def export_blocks(self, filename):
-        with open(filename, 'wb') as f:
-            f.write(self.loaded_map.get_blocks_data(self.selected_layer))
+        map_files.export_blocks(self.loaded_map, self.selected_layer, filename)
 
     def import_blocks(self, filename):
-        with open(filename, 'rb') as f:
-            raw_data = f.read()
-        self.loaded_map.set_blocks_data(self.selected_layer, raw_data)
+        map_files.import_blocks(self.loaded_map, self.selected_layer, filename)
 
     def export_blocks_behaviour(self, filename):
-        with open(filename, 'wb') as f:
-            f.write(self.loaded_map.get_blocks_behaviour_data(self.selected_layer))
+        map_files.export_blocks_behaviour(self.loaded_map, self.selected_layer, filename)
 
     def import_blocks_behaviour(self, filename):
-        with open(filename, 'rb') as f:
-            raw_data = f.read()
-        self.loaded_map.set_blocks_behaviour_data(self.selected_layer, raw_data)
+        map_files.import_blocks_behaviour(self.loaded_map, self.selected_layer, filename)
 
     def export_map_layer(self, filename):
-        with open(filename, 'wb') as f:
-            f.write(self.loaded_map.get_layer_data(self.selected_layer))
+        map_files.export_layer(self.loaded_map, self.selected_layer, filename)
 
     def import_map_layer(self, filename):
-        with open(filename, 'rb') as f:
-            raw_data = f.read()
-        self.loaded_map.set_layer_data(self.selected_layer, raw_data)
+        map_files.import_layer(self.loaded_map, self.selected_layer, filename)
 
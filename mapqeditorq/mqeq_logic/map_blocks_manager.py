@@ -24,7 +24,7 @@ class GroupBlocksHeadersTable(StructTableBase):
 
     def extract_array(self, game):
         address = game.get_blocks_header_pointer(self.group)
-        return game.get_mapdata_generic_header_array(address)
+        return self.table_from_rows(game.get_mapdata_generic_header_table(address).tolist())
 
 
 class MapBlocksManager:
@@ -98,6 +98,9 @@ class MapBlocksManager:
 
     def load_main_table(self, game):
         self.main_table.load(game)
+        self.write_repoints(game)
+
+    def write_repoints(self, game):
         fn = common.resource_path_join(
             common.ASM_PATCHES_DIR,
             'map_blocks_table_repoint.sinc'
@@ -0,0 +1,195 @@
+
+import abc
+import io
+import os
+
+from PIL import Image
+
+from ..game import gba_image
+from . import common
+from . import file_utils
+from .parsers import hex_format, ParsignError, convert_16_color_palette_to_pal_file_format, \
+    get_16_color_palette_from_pal_file_format
+
+TILESET_IMAGE_SIZE = (128, 256)
+# Palettes shared by every map can't be modified
+MAP_PALETTES = range(2, 15)
+
+
+def open_image(filename):
+    try:
+        img = Image.open(filename)
+    except FileNotFoundError:
+        raise common.MqeqError('The file "{0}" does not exist'.format(filename))
+    except OSError:
+        raise common.MqeqError('Unknown image format'.format(filename))
+    try:
+        gba_image.validate_gbaimage(img)
+    except gba_image.ImageFormatError as e:
+        raise common.MqeqError(str(e))
+    return img
+
+
+def read_binary_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def read_binary_file_of_size(filename, size, data_name):
+    raw_data = read_binary_file(filename)
+    if len(raw_data) != size:
+        raise common.MqeqError('The {0} data has to be {1} bytes long, not {2}'.format(data_name, size, len(raw_data)))
+    return raw_data
+
+
+def export_layer(map_obj, layer_num, filename):
+    file_utils.write_file_if_changed(filename, map_obj.get_layer_data(layer_num), 'wb')
+
+
+def import_layer(map_obj, layer_num, filename):
+    raw_data = read_binary_file_of_size(filename, len(map_obj.get_layer_data(layer_num)), 'layer')
+    map_obj.set_layer_data(layer_num, raw_data)
+
+
+def export_blocks(map_obj, layer_num, filename):
+    file_utils.write_file_if_changed(filename, map_obj.get_blocks_data(layer_num), 'wb')
+
+
+def import_blocks(map_obj, layer_num, filename):
+    # Fewer blocks would leave cells of the layers with blocks that don't exist
+    raw_data = read_binary_file_of_size(filename, len(map_obj.get_blocks_data(layer_num)), 'blocks')
+    map_obj.set_blocks_data(layer_num, raw_data)
+
+
+def export_blocks_behaviour(map_obj, layer_num, filename):
+    file_utils.write_file_if_changed(filename, map_obj.get_blocks_behaviour_data(layer_num), 'wb')
+
+
+def import_blocks_behaviour(map_obj, layer_num, filename):
+    map_obj.set_blocks_behaviour_data(layer_num, read_binary_file(filename))
+
+
+def export_tileset(map_obj, tileset_num, pal_num, filename):
+    png = io.BytesIO()
+    map_obj.get_tileset_sheet(pal_num, tileset_num).save(png, 'PNG')
+    file_utils.write_file_if_changed(filename, png.getvalue(), 'wb')
+
+
+def import_tileset(map_obj, tileset_num, filename):
+    img = open_image(filename)
+    if img.size != TILESET_IMAGE_SIZE:
+        raise common.MqeqError('The tileset image size has to be {0}x{1} px'.format(*TILESET_IMAGE_SIZE))
+    return map_obj.change_tileset_image(tileset_num, img)
+
+
+def export_palette(map_obj, pal_num, filename):
+    palette = map_obj.get_palette(pal_num)
+    file_utils.write_file_if_changed(filename, convert_16_color_palette_to_pal_file_format(palette), newline='\r\n')
+
+
+def import_palette(map_obj, pal_num, filename):
+    if pal_num not in MAP_PALETTES:
+        raise common.MqeqError('This palette does not belong to the map')
+    with open(filename, newline='\r\n') as f:
+        contents = f.read()
+    try:
+        palette = get_16_color_palette_from_pal_file_format(contents)
+    except ParsignError as e:
+        raise common.MqeqError('{0}: {1}'.format(filename, e))
+    map_obj.set_palette(pal_num, palette)
+
+
+class MapFiles(abc.ABC):
+    """
+    Files with one kind of data of a map, in a directory, named after the map,
+    the group or the tilesets they belong to.
+    """
+    FILENAME_FORMAT = None
+    NUMBERS = ()
+
+    def get_filename(self, directory, map_obj, number):
+        group, subindex = map_obj.get_indexes()
+        return os.path.join(directory, self.FILENAME_FORMAT.format(
+            group=hex_format(group),
+            subindex=hex_format(subindex),
+            tilesets=hex_format(map_obj.header.tileset_subindex),
+            number=number
+        ))
+
+    def get_filenames(self, directory, map_obj):
+        return [(number, self.get_filename(directory, map_obj, number)) for number in self.NUMBERS]
+
+    @abc.abstractmethod
+    def export_file(self, map_obj, number, filename):
+        raise NotImplementedError('You must override this')
+
+    @abc.abstractmethod
+    def import_file(self, map_obj, number, filename):
+        raise NotImplementedError('You must override this')
+
+
+class LayerFiles(MapFiles):
+    FILENAME_FORMAT = 'map_{group}_{subindex}_layer_{number}.bin'
+    NUMBERS = range(2)
+
+    def export_file(self, map_obj, number, filename):
+        export_layer(map_obj, number, filename)
+
+    def import_file(self, map_obj, number, filename):
+        import_layer(map_obj, number, filename)
+
+
+class BlocksFiles(MapFiles):
+    FILENAME_FORMAT = 'group_{group}_blocks_{number}.bin'
+    NUMBERS = range(2)
+
+    def export_file(self, map_obj, number, filename):
+        export_blocks(map_obj, number, filename)
+
+    def import_file(self, map_obj, number, filename):
+        import_blocks(map_obj, number, filename)
+
+
+class BehavioursFiles(MapFiles):
+    FILENAME_FORMAT = 'group_{group}_behaviours_{number}.bin'
+    NUMBERS = range(2)
+
+    def export_file(self, map_obj, number, filename):
+        export_blocks_behaviour(map_obj, number, filename)
+
+    def import_file(self, map_obj, number, filename):
+        import_blocks_behaviour(map_obj, number, filename)
+
+
+class TilesetFiles(MapFiles):
+    FILENAME_FORMAT = 'group_{group}_tileset_{tilesets}_{number}.png'
+    NUMBERS = range(3)
+
+    def __init__(self, pal_num=2):
+        self.pal_num = pal_num
+
+    def export_file(self, map_obj, number, filename):
+        export_tileset(map_obj, number, self.pal_num, filename)
+
+    def import_file(self, map_obj, number, filename):
+        import_tileset(map_obj, number, filename)
+
+
+class PaletteFiles(MapFiles):
+    FILENAME_FORMAT = 'group_{group}_palette_{tilesets}_{number}.pal'
+    NUMBERS = MAP_PALETTES
+
+    def export_file(self, map_obj, number, filename):
+        export_palette(map_obj, number, filename)
+
+    def import_file(self, map_obj, number, filename):
+        import_palette(map_obj, number, filename)
+
+
+MAP_FILES = {
+    'layers': LayerFiles,
+    'blocks': BlocksFiles,
+    'behaviours': BehavioursFiles,
+    'tilesets': TilesetFiles,
+    'palettes': PaletteFiles,
+}
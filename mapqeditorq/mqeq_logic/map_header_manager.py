@@ -65,6 +65,9 @@ class MapHeaderManager:
 
     def load_main_table(self, game):
         self.main_table.load(game)
+        self.write_repoints(game)
+
+    def write_repoints(self, game):
         fn = common.resource_path_join(
             common.ASM_PATCHES_DIR,
             'map_headers_table_repoint.sinc'
@@ -34,7 +34,7 @@ class MapLayerHeadersTable(StructTableBase):
 
     def extract_array(self, game):
         address = game.get_map_layer_headers_address(self.map_index, self.map_subindex)
-        return game.get_mapdata_generic_header_array(address)
+        return self.table_from_rows(game.get_mapdata_generic_header_table(address).tolist())
 
 
 class MapLayerManager:
@@ -119,6 +119,9 @@ class MapLayerManager:
 
     def load_main_table(self, game):
         self.main_table.load(game)
+        self.write_repoints(game)
+
+    def write_repoints(self, game):
         fn = common.resource_path_join(
             common.ASM_PATCHES_DIR,
             'map_layers_table_repoint.sinc'
@@ -146,7 +149,7 @@ class MapLayerManager:
             self.main_table.save()
 
     def load_headers_table(self, game, map_index, map_subindex):
-        if self.group_table is None:
+        if self.group_table is None or self.group_table.group != map_index:
             self.load_group_table(game, map_index)
 
         self.loaded_map_headers_table = MapLayerHeadersTable(
@@ -8,9 +8,13 @@ from ..maps.common import MapDataGenericHeader
 from ..maps.tilesets import Tileset
 
 
+import io
+import logging
 import os
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
 
 class MapTilesetsMainTable(NumberTableBase):
     def extract_array(self, game):
@@ -37,7 +41,7 @@ class GroupTilesetsHeadersTable(StructTableBase):
 
     def extract_array(self, game):
         address = game.get_tilesets_and_palette_headers_ptr(self.group, self.tilesets_index)
-        return game.get_mapdata_generic_header_array(address)
+        return self.table_from_rows(game.get_mapdata_generic_header_table(address).tolist())
 
 
 class TilesetIncBinManager:
@@ -60,23 +64,17 @@ class TilesetIncBinManager:
         return self.tileset_obj.was_modified()
 
     def save(self):
-        img = self.tileset_obj.get_full_tileset(0)
-        w, h = img.size
-        img = img.resize((w // 2, h // 2))
-        img.save(self.img_filename, 'PNG')
-
-        with file_utils.TextFileEditor(
-                self.definition_filename,
-                file_header=common.MAP_FILES_INCLUDES) as f:
-            txt = f.read_contents()
-            new_txt = self.get_initialization_text()
-            if not CParser.is_definition_in_text(self.definition, txt):
-                txt = CParser.change_initialization(
-                    txt, self.definition, new_txt
-                )
-                f.write(txt)
-            else:
-                f.cancel()
+        editor = file_utils.CSourceEditor(self.definition_filename, file_header=common.MAP_FILES_INCLUDES)
+        self.save_to_editor(editor)
+        editor.save()
+
+    def save_to_editor(self, editor):
+        img_data = io.BytesIO()
+        self.tileset_obj.get_sheet_img(0).save(img_data, 'PNG')
+        file_utils.write_file_if_changed(self.img_filename, img_data.getvalue(), 'wb')
+
+        if not editor.is_declared(self.definition):
+            editor.append(self.get_initialization_text())
         self.tileset_obj.modified = False
 
         if isinstance(self.tileset_obj.header.get_compressed_data_ptr(), int):
@@ -115,25 +113,19 @@ class PalettesIncBinManager:
         return self.pal_obj.was_modified()
 
     def save(self):
+        editor = file_utils.CSourceEditor(self.definition_filename, file_header=common.MAP_FILES_INCLUDES)
+        self.save_to_editor(editor)
+        editor.save()
+
+    def save_to_editor(self, editor):
         for i in range(2, 15):
             filename = self.pal_base_filename.format(i)
-            palette = self.pal_obj.palettes_list[i]
+            palette = self.pal_obj.get_palette(i)
             pal_data = convert_16_color_palette_to_pal_file_format(palette)
-            with file_utils.EasyOpen(filename, 'w', newline='\r\n') as f:
-                f.write(pal_data)
-
-        with file_utils.TextFileEditor(
-                self.definition_filename,
-                file_header=common.MAP_FILES_INCLUDES) as f:
-            txt = f.read_contents()
-            if not CParser.is_definition_in_text(self.definition, txt):
-                initialization = self.get_initialization_text()
-                txt = CParser.change_initialization(
-                    txt, self.definition, initialization
-                )
-                f.write(txt)
-            else:
-                f.cancel()
+            file_utils.write_file_if_changed(filename, pal_data, newline='\r\n')
+
+        if not editor.is_declared(self.definition):
+            editor.append(self.get_initialization_text())
         if isinstance(self.pal_obj.header1.masked_data_ptr, int):
             self.pal_obj.header1.set_palettes_ptr('&' + self.definition.get_label())
             self.pal_obj.header1.add_dependency(self.definition)
@@ -244,6 +236,9 @@ class MapTilesetAndPalettesManager:
 
     def load_main_table(self, game):
         self.main_table.load(game)
+        self.write_repoints(game)
+
+    def write_repoints(self, game):
         fn = common.resource_path_join(
             common.ASM_PATCHES_DIR,
             'map_tilesets_and_palettes_table_repoint.sinc'
@@ -286,7 +281,7 @@ class MapTilesetAndPalettesManager:
         header_type = header.header_type()
         if header_type in self.TILESET_IDNTIFIER:
             return self.TILESET_IDNTIFIER[header_type]
-        print('Unknown decompress address: {}'.format(hex(header.uncompress_address)))
+        logger.warning('Unknown decompress address: %s', hex(header.uncompress_address))
         return None
 
     def get_tilesets_load_palettes(self, game, map_index, tilesets_index, palettes_obj):
@@ -32,15 +32,7 @@ class SpecificMapWarpsTable(StructTableBase):
         self.map_subindex = map_subindex
 
     def extract_array(self, game):
-        array = []
-        address = game.get_warps_array_ptr(self.map_index, self.map_subindex)
-        while True:
-            warps_struct = game.read_struct_at(address, MapWarp)
-            array.append(warps_struct)
-            if warps_struct.unk_0 == 0xFFFF:
-                break
-            address += MapWarp.size()
-        return array
+        return self.table_from_rows(game.get_warps_table(self.map_index, self.map_subindex).tolist())
 
 
 class MapWarpsManager:
@@ -101,6 +93,9 @@ class MapWarpsManager:
 
     def load_main_table(self, game):
         self.main_table.load(game)
+        self.write_repoints(game)
+
+    def write_repoints(self, game):
         fn = common.resource_path_join(
             common.ASM_PATCHES_DIR,
             'map_warps_table_repoint.sinc'
@@ -128,7 +123,7 @@ class MapWarpsManager:
             self.main_table.save()
 
     def load_headers_table(self, game, map_index, map_subindex):
-        if self.group_table is None:
+        if self.group_table is None or self.group_table.group != map_index:
             self.load_group_table(game, map_index)
 
         self.loaded_map_warps_table = SpecificMapWarpsTable(
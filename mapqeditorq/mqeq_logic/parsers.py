@@ -16,46 +16,198 @@ def hex_format(num, digits=2):
     return ('{0:0>' + str(digits) + '}').format(hex(num)[2::])
 
 
-class CParser:
-    @staticmethod
-    def get_custom_initialization_pattern(definition, start_pattern, end_pattern, unlimited=True):
-        pattern = ('', r'.*')[unlimited] + definition.to_regex() \
-                  + r'\s*=\s*' + start_pattern + r'(.*?)' + end_pattern \
-                  + r'\s*;' + ('', r'.*')[unlimited]
-        return pattern
+class CStatement:
+    __slots__ = ('declaration', 'start', 'end', 'initializer_start', 'initializer_end')
+
+    def __init__(self, declaration, start, end, initializer_start=None, initializer_end=None):
+        self.declaration = declaration
+        self.start = start
+        self.end = end
+        self.initializer_start = initializer_start
+        self.initializer_end = initializer_end
+
+    def is_initialized(self):
+        return self.initializer_start is not None
+
+
+class CSourceIndex:
+    """
+    Top level statements of a C source, found in a single pass of a tokenizer.
+    Each statement keeps its declaration (the tokens before the '=', without
+    comments or whitespace between them), its span and the span of its initializer.
+    """
+    # Runs of characters without meaning for the structure of the source are a single token
+    TOKEN_REGEX = re.compile(r'''
+        (?P<comment>/\*.*?\*/|//[^\n]*)
+        |(?P<preprocessor>\#(?:\\\n|[^\n])*)
+        |(?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+        |(?P<other>[^;={}()\[\]"'/\#]+)
+        |(?P<punctuation>.)
+    ''', re.VERBOSE | re.DOTALL)
+    # Everything up to the ';' ending an initializer
+    INITIALIZER_REGEX = re.compile(r'''
+        (?:[^;"'/]+
+        |"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'
+        |/\*.*?\*/|//[^\n]*
+        |["'/])*
+    ''', re.VERBOSE | re.DOTALL)
+    COMMENT_OR_STRING_REGEX = re.compile(
+        r'(/\*.*?\*/|//[^\n]*)|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL
+    )
+    DECLARATION_TOKEN_REGEX = re.compile(r'(?P<word>\w+)|(?P<space>\s+)|(?P<punctuation>.)', re.DOTALL)
+    VISIBILITY_PREFIXES = ('static ', 'extern ')
+
+    def __init__(self, txt):
+        self.txt = txt
+        self.statements = []
+        self.by_declaration = {}
+        self.by_declaration_without_visibility = {}
+        self.parse()
 
     @classmethod
-    def get_initialization_pattern(cls, definition, group_curly_brackets=True, unlimited=True):
-        pattern = cls.get_custom_initialization_pattern(
-            definition,
-            (r'\{\s*', '')[group_curly_brackets],
-            (r'\s*\}', '')[group_curly_brackets],
-            unlimited
-        )
-        return pattern
+    def of(cls, source):
+        """Index of source, which can be the text or an already built index."""
+        if isinstance(source, cls):
+            return source
+        return cls(source)
 
-    @staticmethod
-    def remove_comments(txt):
-        no_block_comments = re.sub(r'/\*.*?\*/', r'', txt, flags=re.DOTALL)
-        no_line_comments = re.sub(r'//.*', r'', no_block_comments, flags=re.DOTALL)
-        return no_line_comments
+    @classmethod
+    def remove_comments(cls, txt):
+        return cls.COMMENT_OR_STRING_REGEX.sub(lambda m: '' if m.group(1) else m.group(), txt)
 
     @classmethod
-    def get_array_contents_text(cls, txt, definition):
-        txt = cls.remove_comments(txt)
-        pattern = cls.get_initialization_pattern(definition, group_curly_brackets=False)
-        m = re.match(pattern, txt, re.DOTALL)
-        if m is None:
+    def normalize(cls, txt):
+        # Whitespace is only kept between two words
+        ret = ''
+        previous_is_word = False
+        for m in cls.DECLARATION_TOKEN_REGEX.finditer(cls.remove_comments(txt)):
+            kind = m.lastgroup
+            if kind == 'space':
+                continue
+            is_word = kind == 'word'
+            if is_word and previous_is_word:
+                ret += ' '
+            ret += m.group()
+            previous_is_word = is_word
+        return ret
+
+    def parse(self):
+        txt = self.txt
+        position = 0
+        start = None
+        depth = 0
+        declaration_end = None
+        initializer_start = None
+        is_function = False
+        previous = None
+        while position < len(txt):
+            m = self.TOKEN_REGEX.match(txt, position)
+            position = m.end()
+            kind = m.lastgroup
+            if kind in ('comment', 'preprocessor'):
+                continue
+
+            value = m.group()
+            if kind == 'other':
+                stripped = value.lstrip()
+                if not stripped:
+                    continue
+                if start is None:
+                    start = m.end() - len(stripped)
+                previous = stripped
+                continue
+
+            if start is None:
+                start = m.start()
+            statement_end = None
+            if depth == 0 and value == ';':
+                statement_end = m.end()
+            elif value in '{([':
+                if depth == 0 and value == '{' and initializer_start is None and previous == ')':
+                    is_function = True
+                    declaration_end = m.start()
+                depth += 1
+            elif value in '})]':
+                depth -= 1
+                if depth == 0 and is_function:
+                    statement_end = m.end()
+            elif depth == 0 and value == '=' and initializer_start is None:
+                declaration_end = m.start()
+                initializer_start = m.end()
+                # There are no statements inside an initializer, it is skipped up to its ';'
+                position = self.INITIALIZER_REGEX.match(txt, position).end()
+
+            if statement_end is not None:
+                if declaration_end is None:
+                    declaration_end = m.start()
+                initializer_end = None if initializer_start is None else m.start()
+                declaration = self.normalize(txt[start:declaration_end])
+                if declaration:
+                    self.add_statement(CStatement(
+                        declaration, start, statement_end, initializer_start, initializer_end
+                    ))
+                start = None
+                depth = 0
+                declaration_end = None
+                initializer_start = None
+                is_function = False
+            previous = value
+
+    def add_statement(self, statement):
+        self.statements.append(statement)
+        self.by_declaration.setdefault(statement.declaration, []).append(statement)
+        declaration = statement.declaration
+        for prefix in self.VISIBILITY_PREFIXES:
+            if declaration.startswith(prefix):
+                declaration = declaration[len(prefix):]
+                break
+        self.by_declaration_without_visibility.setdefault(declaration, []).append(statement)
+
+    def find_statements(self, definition):
+        key = self.normalize(definition.to_c_format())
+        if definition.visibility is None:
+            # Like in C, a definition without visibility matches a static or extern one
+            return self.by_declaration_without_visibility.get(key, [])
+        return self.by_declaration.get(key, [])
+
+    def get_definition(self, definition):
+        """First statement initializing the definition, or None."""
+        for statement in self.find_statements(definition):
+            if statement.is_initialized():
+                return statement
+        return None
+
+    def is_declared(self, definition):
+        return len(self.find_statements(definition)) > 0
+
+    def is_prototype_declared(self, definition):
+        for statement in self.find_statements(definition):
+            if not statement.is_initialized():
+                return True
+        return False
+
+    def get_initializer_text(self, definition):
+        statement = self.get_definition(definition)
+        if statement is None:
+            raise DefinitionNotFoundError('Definition of {0} not found.'.format(definition.get_label()))
+        return self.remove_comments(self.txt[statement.initializer_start:statement.initializer_end]).strip()
+
+
+class CParser:
+    @classmethod
+    def get_array_contents_text(cls, source, definition):
+        initializer = CSourceIndex.of(source).get_initializer_text(definition)
+        if len(initializer) < 2 or initializer[0] != '{' or initializer[-1] != '}':
             raise DefinitionNotFoundError('Array definition specified not found.')
 
-        array_contents_txt = m.group(1)
+        array_contents_txt = initializer[1:-1].strip()
         if array_contents_txt and array_contents_txt[-1] != ',':
             array_contents_txt += ','
         return array_contents_txt
 
     @classmethod
-    def parse_struct_array(cls, txt, definition):
-        array_contents_txt = cls.get_array_contents_text(txt, definition)
+    def parse_struct_array(cls, source, definition):
+        array_contents_txt = cls.get_array_contents_text(source, definition)
 
         array_contents = []
         it = re.finditer(r'\s*(\{.*?\})\s*,', array_contents_txt, flags=re.DOTALL)
@@ -79,35 +231,40 @@ class CParser:
         return ret
 
     @classmethod
-    def parse_number_array(cls, txt, definition):
-        array_contents_txt = cls.get_array_contents_text(txt, definition)
+    def parse_number_array(cls, source, definition):
+        array_contents_txt = cls.get_array_contents_text(source, definition)
         return cls.parse_comma_separated_num(array_contents_txt)
 
-    @classmethod
-    def change_initialization(cls, old_txt, definition, new_initialization):
-        pattern = cls.get_initialization_pattern(definition, unlimited=False)
-        if cls.is_definition_in_text(definition, old_txt):
-            new_txt = re.sub(pattern, new_initialization, old_txt, flags=re.DOTALL)
+    @staticmethod
+    def change_initialization(old_source, definition, new_initialization):
+        index = CSourceIndex.of(old_source)
+        statement = index.get_definition(definition)
+        if statement is not None:
+            new_txt = index.txt[:statement.start] + new_initialization + index.txt[statement.end:]
         else:
-            new_txt = old_txt + '\n\n' + new_initialization
+            new_txt = index.txt + '\n\n' + new_initialization
 
         return new_txt
 
     @staticmethod
-    def is_definition_in_text(definition, text):
-        pattern = r'.*' + definition.to_regex() + r'.*'
-        m = re.match(pattern, text, re.DOTALL)
-        return m is not None
+    def is_definition_in_text(definition, source):
+        return CSourceIndex.of(source).is_declared(definition)
 
     @staticmethod
-    def is_prototype_declared(definition, text):
-        pattern = r'.*' + definition.to_regex() + r'\s*;.*'
-        m = re.match(pattern, text, re.DOTALL)
-        return m is not None
+    def is_prototype_declared(definition, source):
+        return CSourceIndex.of(source).is_prototype_declared(definition)
 
     @staticmethod
-    def format_initialization(definition, contents):
-        return definition.to_c_format() + ' = {\n' + contents + '};\n\n'
+    def format_initializer(contents):
+        return '{\n' + contents + '}'
+
+    @staticmethod
+    def format_initialization_with_initializer(definition, initializer):
+        return definition.to_c_format() + ' = ' + initializer + ';\n\n'
+
+    @classmethod
+    def format_initialization(cls, definition, contents):
+        return cls.format_initialization_with_initializer(definition, cls.format_initializer(contents))
 
     @staticmethod
     def format_array_contents(array):
@@ -129,14 +286,13 @@ class CParser:
             ret += '\tINCBIN_U8("{0}"),\n'.format(filename)
         return ret + '};'
 
-    @classmethod
-    def get_filename_from_incbin(cls, txt, definition):
-        pattern = cls.get_custom_initialization_pattern(
-            definition,
-            r'INCBIN_U8\(\s*\"',
-            r'\"\)\s*'
-        )
-        m = re.match(pattern, txt, re.DOTALL)
+    @staticmethod
+    def get_filename_from_incbin(source, definition):
+        try:
+            initializer = CSourceIndex.of(source).get_initializer_text(definition)
+        except DefinitionNotFoundError:
+            initializer = ''
+        m = re.fullmatch(r'INCBIN_U8\(\s*"(.*?)"\)', initializer, re.DOTALL)
         if m is None:
             raise DefinitionNotFoundError('Binary inclusion not found.')
         return m.group(1)
@@ -178,19 +334,6 @@ class CDefinition:
         ret += ''.join(self.base_format.format(self.label).split())
         return ret
 
-    def to_regex(self):
-        if self.visibility == self.STATIC:
-            ret = r'static\s+'
-        elif self.visibility == self.EXTERN:
-            ret = r'extern\s+'
-        else:
-            ret = ''
-        ret += r'\s+'.join(self.type.strip().split()) + r'\s+'
-        ret += r'\s*'.join(
-            re.escape(part) for part in self.base_format.format(self.label).split()
-        )
-        return ret
-
     def __repr__(self):
         return self.to_c_format()
 
@@ -209,6 +352,7 @@ class AsmParser:
 
 
 class ParseableStructBase(StructureBase):
+    __slots__ = ('modified', 'dependencies')
     ATTR_STR_MASK = {}
 
     def __init__(self):
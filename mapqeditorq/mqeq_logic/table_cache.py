@@ -0,0 +1,101 @@
+import hashlib
+import os
+import struct
+
+from . import file_utils
+
+
+class TableCache:
+    """
+    Keeps the tables parsed from C sources in small binary files, so sources
+    that did not change are not parsed again.
+    Each cached table is stamped with the size and sha1 of its source, and
+    the sha1 is checked every time: modification times can't be trusted
+    (they have a coarse resolution and can be restored by tools).
+    Rows are tuples of ints and strings (labels and macros).
+    """
+    MAGIC = b'MQT2'
+    #                               magic, size, sha1, rows, columns
+    HEADER_STRUCT = struct.Struct('<4sQ20sII')
+    INT_STRUCT = struct.Struct('<q')
+    STR_LENGTH_STRUCT = struct.Struct('<H')
+    INT_TAG = 0
+    STR_TAG = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        file_utils.mkdirs_p(directory)
+
+    def get_cache_filename(self, filename, label):
+        key = '{0}:{1}'.format(os.path.abspath(filename), label)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.tbl')
+
+    @staticmethod
+    def get_file_hash(filename):
+        with open(filename, 'rb') as f:
+            return hashlib.sha1(f.read()).digest()
+
+    def load(self, filename, label):
+        """Returns the rows of the table, or None if they are not cached for the current source."""
+        cache_filename = self.get_cache_filename(filename, label)
+        if not os.path.exists(cache_filename) or not os.path.exists(filename):
+            return None
+        with open(cache_filename, 'rb') as f:
+            data = f.read()
+        if len(data) < self.HEADER_STRUCT.size:
+            return None
+        magic, size, file_hash, rows_amount, columns = self.HEADER_STRUCT.unpack_from(data)
+        if magic != self.MAGIC:
+            return None
+        if os.path.getsize(filename) != size or self.get_file_hash(filename) != file_hash:
+            return None
+
+        try:
+            return self.decode_rows(data, self.HEADER_STRUCT.size, rows_amount, columns)
+        except (struct.error, IndexError, UnicodeDecodeError, ValueError):
+            return None
+
+    def save(self, filename, label, rows):
+        columns = len(rows[0]) if rows else 0
+        try:
+            encoded_rows = self.encode_rows(rows)
+        except (struct.error, TypeError):
+            # Values that do not fit in the format are not cached
+            return
+        header = self.HEADER_STRUCT.pack(
+            self.MAGIC, os.path.getsize(filename), self.get_file_hash(filename), len(rows), columns
+        )
+        file_utils.write_file_if_changed(self.get_cache_filename(filename, label), header + encoded_rows, 'wb')
+
+    def encode_rows(self, rows):
+        data = bytearray()
+        for row in rows:
+            for value in row:
+                if isinstance(value, int):
+                    data.append(self.INT_TAG)
+                    data += self.INT_STRUCT.pack(value)
+                else:
+                    encoded = value.encode('utf-8')
+                    data.append(self.STR_TAG)
+                    data += self.STR_LENGTH_STRUCT.pack(len(encoded)) + encoded
+        return bytes(data)
+
+    def decode_rows(self, data, offset, rows_amount, columns):
+        rows = [None] * rows_amount
+        for i in range(rows_amount):
+            row = [None] * columns
+            for j in range(columns):
+                tag = data[offset]
+                offset += 1
+                if tag == self.INT_TAG:
+                    row[j] = self.INT_STRUCT.unpack_from(data, offset)[0]
+                    offset += self.INT_STRUCT.size
+                elif tag == self.STR_TAG:
+                    length = self.STR_LENGTH_STRUCT.unpack_from(data, offset)[0]
+                    offset += self.STR_LENGTH_STRUCT.size
+                    row[j] = data[offset:offset + length].decode('utf-8')
+                    offset += length
+                else:
+                    raise ValueError('Unknown value tag {0}'.format(tag))
+            rows[i] = tuple(row)
+        return rows
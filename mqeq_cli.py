@@ -0,0 +1,9 @@
+#! /usr/bin/env python3
+
+if __name__ == '__main__':
+    import logging
+    import sys
+    from mapqeditorq.mqeq_logic.cli import main
+
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    sys.exit(main())
@@ -4,11 +4,13 @@ import sys
 import os
 
 version = 'git'
-scripts = ['mqeq.py']
+scripts = ['mqeq.py', 'mqeq_cli.py']
+# Scripts that write to the console, so they are not frozen as GUI executables
+console_scripts = ['mqeq_cli.py']
 
 data_files = ['resources', 'README.txt']
 
-build_exe_options = {'packages': ['os', 'PyQt5', 'PIL', 'mapqeditorq'],
+build_exe_options = {'packages': ['os', 'PyQt5', 'PIL', 'numpy', 'mapqeditorq'],
                      'includes': ['sip'],
                      'excludes': 'tkinter',
                      'include_files': data_files,
@@ -25,7 +27,8 @@ if '--no-freeze' not in sys.argv:
         from cx_Freeze import setup, Executable
 
         for script in scripts:
-            executables.append(Executable(script, base=base, icon=os.path.abspath('resources/mqeq-icon.ico')))
+            script_base = None if script in console_scripts else base
+            executables.append(Executable(script, base=script_base, icon=os.path.abspath('resources/mqeq-icon.ico')))
     except ImportError:
         print('cx_Freeze not found. Using distutils instead.')
 else:
@@ -47,7 +50,7 @@ setup(name='MQEQ - Map Editor',
       author='Kaiser de Emperana (Mauro B.)',
       url='https://github.com/kaisermg5/mapqeditorq',
       options={"build_exe": build_exe_options},
-      requires=['sip', 'PyQt5', 'PIL'],
+      requires=['sip', 'PyQt5', 'PIL', 'numpy'],
       scripts=scripts,
       packages=['mapqeditorq'],
       executables=executables
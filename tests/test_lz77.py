@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Round-trip, VRAM safety and size checks of the lz77 module.
+The files in lz77_baseline are the outputs of the encoder this one replaced
+(lz77.compress of the first commit of the repository) for BASELINE_INPUTS.
+"""
+
+import os
+import random
+
+import pytest
+
+from mapqeditorq.game import lz77
+from mapqeditorq.game.lz77_benchmark import CORPORA
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'lz77_baseline')
+
+BASELINE_INPUTS = dict(
+    [(name, make_corpus()) for name, make_corpus in CORPORA] + [
+        ('zeros', bytes(0x1000)),
+        ('ramp', bytes(range(256)) * 20),
+    ]
+)
+
+
+def read_baseline(name):
+    with open(os.path.join(BASELINE_DIR, name + '.lz'), 'rb') as f:
+        return f.read()
+
+
+def fuzz_inputs(seed=3, amount=40):
+    yield b''
+    yield b'\x00'
+    yield b'\x01\x02'
+    yield b'\x07' * 3
+    yield b'\x00' * 0x10000
+    yield b'\xab\xcd' * 1000
+    # Matches right at the edge of the window
+    block = bytes(random.Random(seed).randrange(256) for _ in range(64))
+    for gap in (0x1000 - 64, 0x1000 - 63, 0x1000):
+        yield block + bytes(random.Random(gap).randrange(256) for _ in range(gap)) + block
+
+    rng = random.Random(seed)
+    for _ in range(amount):
+        alphabet = rng.choice((1, 2, 3, 4, 16, 256))
+        data = bytes(rng.randrange(alphabet) for _ in range(rng.randrange(0x1400)))
+        if rng.random() < 0.3 and data:
+            start = rng.randrange(len(data))
+            data += data[start:start + rng.randrange(1, 40)] * rng.randrange(1, 10)
+        yield data
+
+
+INPUTS = list(fuzz_inputs()) + list(BASELINE_INPUTS.values())
+INPUT_IDS = ['input{0}_len{1}'.format(i, len(data)) for i, data in enumerate(INPUTS)]
+
+
+def read_tokens(compressed_data):
+    """Straightforward walk over the blocks, as described in GBATEK. Returns the (length, distance) of each block."""
+    size = int.from_bytes(compressed_data[1:4], 'little')
+    tokens = []
+    decompressed_size = 0
+    pos = 4
+    while decompressed_size < size:
+        flags = compressed_data[pos]
+        pos += 1
+        for bit in range(7, -1, -1):
+            if decompressed_size >= size:
+                break
+            if flags & (1 << bit):
+                length = 3 + (compressed_data[pos] >> 4)
+                distance = 1 + (((compressed_data[pos] & 0xf) << 8) | compressed_data[pos + 1])
+                pos += 2
+            else:
+                length, distance = 1, 0
+                pos += 1
+            tokens.append((length, distance))
+            decompressed_size += length
+    return tokens, pos
+
+
+@pytest.mark.parametrize('optimal', (False, True))
+@pytest.mark.parametrize('data', INPUTS, ids=INPUT_IDS)
+def test_roundtrip(data, optimal):
+    compressed = lz77.compress(data, optimal)
+    # Decompressed from inside a bigger buffer, as from a rom
+    decompressed, compressed_size = lz77.decompress(b'\xff' * 5 + compressed, 5)
+    assert bytes(decompressed) == data
+    assert len(compressed) % 4 == 0
+    assert 0 <= len(compressed) - compressed_size < 4
+
+
+@pytest.mark.parametrize('optimal', (False, True))
+@pytest.mark.parametrize('data', INPUTS, ids=INPUT_IDS)
+def test_vram_safe(data, optimal):
+    # The BIOS writes to VRAM by halfwords, so a match can't copy the byte just written
+    tokens, _ = read_tokens(lz77.compress(data, optimal))
+    assert all(distance >= lz77.MIN_MATCH_DISTANCE for length, distance in tokens if length > 1)
+
+
+@pytest.mark.parametrize('data', INPUTS, ids=INPUT_IDS)
+def test_optimal_not_bigger_than_greedy(data):
+    assert len(lz77.compress(data, True)) <= len(lz77.compress(data))
+
+
+@pytest.mark.parametrize('name', sorted(BASELINE_INPUTS))
+def test_baseline_output_decompresses(name):
+    decompressed, _ = lz77.decompress(read_baseline(name))
+    assert bytes(decompressed) == BASELINE_INPUTS[name]
+
+
+@pytest.mark.parametrize('optimal', (False, True))
+@pytest.mark.parametrize('name', sorted(BASELINE_INPUTS))
+def test_not_bigger_than_baseline(name, optimal):
+    assert len(lz77.compress(BASELINE_INPUTS[name], optimal)) <= len(read_baseline(name))